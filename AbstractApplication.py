@@ -1,13 +1,24 @@
 import time
+from contextlib import contextmanager
 from pathlib import Path
-from threading import Thread
-import redis
+from threading import Thread, Event, Lock, current_thread, local
 from loguru import logger
 from emotion_wrapper import add_emotion
+from metrics import ActionMetrics
+from session_log import ChannelSampler
+from session_trace import INBOUND, OUTBOUND, REDACTED, TraceWriter
+from dispatch import BLOCK, DROP_OLDEST, Dispatcher
+from perception import PerceptionFilter
+from codec import Intent, encode_hints, plain, text
+from transport import CONNECTION_ERRORS, Transport
+
+# Calls the arguments of a message (e.g. to decode a payload) only if a sink will actually take the record;
+# bound once, since logger.opt creates a new logger every time
+lazy_logger = logger.opt(lazy=True)
 
 
 class AbstractApplication(object):
-    __topics = [
+    topics = [
         "events_robot",
         "detected_person",
         "recognised_face",
@@ -17,51 +28,268 @@ class AbstractApplication(object):
         "text_speech",
         "picture_newfile"]
 
-    def __init__(self):
-        self.__redis = redis.Redis()
-        self.__pubsub = self.__redis.pubsub(ignore_subscribe_messages=True)
-        self.__pubsub.subscribe(*self.__topics)
-        t = Thread(target=self.__listen)
-        t.start()
+    # Maximum time (in seconds) the listener blocks on the socket before checking if it should stop
+    listen_timeout = 0.1
+    # Time (in seconds) during which actions are collected and then published together in a single Redis pipeline.
+    # When None (the default), every action that is not sent within a batch() is published right away.
+    coalesce_window = None
+    # Whether to keep latency histograms of the actions and intents (see metrics.ActionMetrics)
+    collect_metrics = True
+    # Per perception topic: how its continuously sent messages are coalesced (see perception.PerceptionFilter)
+    # and the interval of that policy in seconds. By default, every message is passed on (to on_person_detected
+    # and on_face_recognized). With ON_CHANGE (e.g. perception.PRESENCE), only the on_person_arrived/left and
+    # on_face_arrived/left functions are triggered instead (a person has left when not detected for the interval).
+    perception_policies = {}
+    # Only every n-th message on these (continuously sent) topics is logged
+    log_sample_rates = {'detected_person': 50, 'recognised_face': 10}
+    # Number of worker threads that run the event functions (see dispatch.Dispatcher), so that a slow or failing
+    # one does not hold up the others; with 0, they run on the listener thread itself
+    dispatch_workers = 2
+    # Per topic: the lane its messages are handled in (in order), the maximum number of queued messages of that lane
+    # and what to do when it is full. Topics that are not listed get a lane of their own.
+    dispatch_lanes = {
+        'events_robot': ('robot', 1000, BLOCK),
+        'detected_person': ('person', 1, DROP_OLDEST),
+        'recognised_face': ('face', 10, DROP_OLDEST),
+        'audio_language': ('speech', 100, BLOCK),
+        'audio_intent': ('speech', 100, BLOCK),
+        'text_speech': ('speech', 100, BLOCK),
+        'picture_newfile': ('picture', 2, DROP_OLDEST),
+        'detected_person_arrived': ('presence', 100, BLOCK),
+        'detected_person_left': ('presence', 100, BLOCK),
+        'recognised_face_arrived': ('presence', 100, BLOCK),
+        'recognised_face_left': ('presence', 100, BLOCK),
+    }
+    # Lanes with a worker of their own, so that e.g. the robot's completion events are always delivered right away
+    fast_lanes = ('robot',)
+    # Action channels that carry credentials (e.g. the Dialogflow key file): only their record, not their data,
+    # is written to a trace
+    secret_channels = ('dialogflow_key',)
+
+    def __init__(self, namespace=None, hub=None, trace=None, transport=None):
+        """Without a namespace, the application uses the plain topic and action channel names (e.g. 'events_robot').
+        With a namespace (e.g. a robot or session id), all channels are prefixed with it ('robot1:events_robot'),
+        so that multiple robots can share a single Redis server. When a SessionHub is given (which requires a
+        namespace), its transport and single listener are used instead of a transport and thread of our own.
+        A trace (a file path or a session_trace.TraceWriter) records all incoming messages and sent actions.
+        The transport is the settings of a transport.Transport of our own (e.g. the 'redis' section of a
+        configuration, to connect over a Unix socket), which records its reconnects in our metrics and is closed
+        when stopping; by default, the Redis server on localhost is used. A Transport can also be given as it is
+        (e.g. with a client of fakeredis), which is then left open."""
+        if hub is not None and namespace is None:
+            raise ValueError('Applications hosted on a SessionHub need a namespace')
+        self.namespace = namespace
+        self.metrics = ActionMetrics() if self.collect_metrics else None
+        self.__log_sampler = ChannelSampler(self.log_sample_rates)
+        self.__perception = PerceptionFilter(self.perception_policies)
+        self.__routes = {self.__channel(topic).encode(): topic for topic in self.topics}
+        self.__handlers = {
+            'events_robot': self.__robot_event,
+            'detected_person': lambda data: self.on_person_detected(),
+            'recognised_face': lambda data: self.on_face_recognized(identifier=text(data)),
+            'audio_language': lambda data: self.on_audio_language(languageKey=text(data)),
+            'audio_intent': self.__audio_intent,
+            'audio_newfile': lambda data: self.on_new_audio_file(audioFile=text(data)),
+            'text_speech': self.__speech_text,
+            'picture_newfile': lambda data: self.on_new_picture_file(pictureFile=text(data)),
+            'detected_person_arrived': lambda data: self.on_person_arrived(),
+            'detected_person_left': lambda data: self.on_person_left(),
+            'recognised_face_arrived': lambda data: self.on_face_arrived(identifier=text(data)),
+            'recognised_face_left': lambda data: self.on_face_left(identifier=text(data)),
+        }
+        self.trace = TraceWriter(trace) if isinstance(trace, str) else trace
+        self.__hub = hub
+        self.__batch = local()
+        self.__pending = []
+        self.__pending_lock = Lock()
+        self.__flush_lock = Lock()
+        self.__pending_event = Event()
+        self.__running = True
+        self.__listener = None
+        self.__lanes = {}
+        if hub is not None:
+            self.__dispatcher = hub.dispatcher
+        else:
+            self.__dispatcher = Dispatcher(self.dispatch_workers) if self.dispatch_workers else None
+        # Only a transport of our own is closed when stopping
+        self.__own_transport = hub is None and not isinstance(transport, Transport)
+        if hub is not None:
+            self.transport = hub.transport
+            hub.register(self)
+        else:
+            if self.__own_transport:
+                transport = Transport(metrics=self.metrics, **(transport or {}))
+            self.transport = transport
+            self.__subscription = self.transport.subscribe([self.__channel(topic) for topic in self.topics])
+            self.__listener = Thread(target=self.__listen)
+            self.__listener.start()
+        if self.coalesce_window is not None:
+            Thread(target=self.__coalesce, daemon=True).start()
+
+    def __channel(self, name):
+        if self.namespace is None:
+            return name
+        return f'{self.namespace}:{name}'
 
     def __listen(self):
-        self.__running = True
         while self.__running:
-            message = self.__pubsub.get_message()
+            # Blocks until a message arrives (or the timeout passes) instead of busy-polling the socket;
+            # while Redis is unreachable, it reconnects (with a backoff) instead
+            message = self.__subscription.get_message(timeout=self.listen_timeout)
             if message is not None:
-                channel = message['channel'].decode()
-                data = message['data'].decode()
-                logger.debug(f"CHANNEL '{channel}': {data}")
-                if channel == self.__topics[0]:
-                    self.on_robot_event(event=data)
-                elif channel == self.__topics[1]:
-                    self.on_person_detected()
-                elif channel == self.__topics[2]:
-                    self.on_face_recognized(identifier=data)
-                elif channel == self.__topics[3]:
-                    self.on_audio_language(languageKey=data)
-                elif channel == self.__topics[4]:
-                    print(data)
-                    data = data.split("|")
-                    print(data)
-                    self.on_audio_intent(data[0], *data[1:])
-                elif channel == self.__topics[5]:
-                    self.on_new_audio_file(audioFile=data)
-                elif channel == self.__topics[6]:
-                    self.on_speech_text(text=data)
-                elif channel == self.__topics[7]:
-                    self.on_new_picture_file(pictureFile=data)
-            else:
-                time.sleep(0.001)
-        self.__pubsub.close()
+                self._receive(message['channel'], message['data'])
+            self._tick()
+        self.__subscription.close()
+
+    def _receive(self, channel, data):
+        """Dispatches a message as it came from Redis (raw bytes, with the namespaced channel).
+        The topic is looked up by the raw channel, and the data is passed on as it is: it is only decoded when
+        (and if) its event function is called."""
+        topic = self.__routes.get(channel)
+        if topic is not None:
+            self._dispatch(topic, data)
+
+    def _dispatch(self, topic, data):
+        """Passes a message (raw bytes or text) on the given (non-namespaced) topic through the perception filter,
+        and then on to its lane (or handles it right away)."""
+        if self.trace is not None:
+            self.trace.write(INBOUND, topic, data)
+        if topic in self.__perception.topics:
+            for topic, data in self.__perception.offer(topic, data, time.monotonic()):
+                self.__deliver(topic, data)
+        else:
+            self.__deliver(topic, data)
+
+    def _tick(self):
+        """Passes on the perception messages and transitions that are due; called whenever the listener wakes up."""
+        for topic, data in self.__perception.tick(time.monotonic()):
+            self.__deliver(topic, data)
+
+    def __deliver(self, topic, data):
+        if self.__log_sampler.should_log(topic):
+            lazy_logger.debug("CHANNEL '{}': {}", lambda: self.__channel(topic), lambda: text(data))
+        if self.__dispatcher is None:
+            try:
+                self.__handlers[topic](data)
+            except Exception as e:
+                logger.exception(f'Handling {topic} failed: {e}')
+            return
+        lane = self.__lanes.get(topic)
+        if lane is None:
+            name, maxsize, policy = self.dispatch_lanes.get(topic, (topic, 100, BLOCK))
+            lane = next((lane for lane in self.__lanes.values() if lane.name == name), None)
+            if lane is None:
+                lane = self.__dispatcher.lane(name, self.__handle, maxsize=maxsize, policy=policy,
+                                              fast=name in self.fast_lanes)
+            self.__lanes[topic] = lane
+        lane.put(topic, data)
+
+    def __handle(self, topic, data):
+        """Calls the event function for a message on the given (non-namespaced) topic."""
+        self.__handlers[topic](data)
+
+    def __robot_event(self, data):
+        event = text(data)
+        if self.metrics is not None:
+            self.metrics.event(event)
+        self.on_robot_event(event=event)
+
+    def __audio_intent(self, data):
+        intent = Intent.decode(data)
+        if self.metrics is not None:
+            self.metrics.heard(f'intent {intent.name}')
+        self.on_audio_intent(intent.name, *intent.params)
+
+    def __speech_text(self, data):
+        if self.metrics is not None:
+            self.metrics.heard('speech text')
+        self.on_speech_text(text=text(data))
 
     def __send(self, channel, data):
-        self.__redis.publish(channel, data)
-        #print("sent " + data + " on " + channel)
+        if self.trace is not None:
+            self.trace.write(OUTBOUND, channel, REDACTED if channel in self.secret_channels else data)
+        if self.metrics is not None:
+            self.metrics.sent(channel, data)
+        channel = self.__channel(channel)
+        actions = getattr(self.__batch, 'actions', None)
+        if actions is not None:
+            actions.append((channel, data))
+        else:
+            self.__publish([(channel, data)])
+
+    def __publish(self, actions):
+        if self.coalesce_window is not None:
+            with self.__pending_lock:
+                self.__pending.extend(actions)
+                self.__pending_event.set()
+        else:
+            self.__execute(actions)
+
+    def __execute(self, actions):
+        try:
+            self.transport.execute(actions)
+        except CONNECTION_ERRORS as e:
+            # Redis did not come back in time: the actions are lost, but the application keeps running
+            logger.error(f'Publishing {len(actions)} actions failed: {e}')
+
+    def __coalesce(self):
+        while self.__running:
+            if self.__pending_event.wait(timeout=self.listen_timeout):
+                time.sleep(self.coalesce_window)
+                self.flush()
+
+    @contextmanager
+    def batch(self):
+        """Collects all actions sent (from the current thread) within the with-block,
+        and publishes them in their original order in a single Redis pipeline (i.e. one round trip) at its end.
+        Nested batches are merged into the outermost one."""
+        if getattr(self.__batch, 'actions', None) is not None:
+            yield
+            return
+        self.__batch.actions = []
+        try:
+            yield
+        finally:
+            actions = self.__batch.actions
+            self.__batch.actions = None
+            self.__publish(actions)
+
+    def _flush_batch(self):
+        """Publishes the actions that the batch() of the current thread collected so far, and keeps collecting.
+        Used by actions that wait for their completion event within a batch (see AsyncAbstractApplication)."""
+        actions = getattr(self.__batch, 'actions', None)
+        if actions:
+            self.__batch.actions = []
+            self.__publish(actions)
+
+    def flush(self):
+        """Publishes all actions that are waiting for the coalesce window to pass right away."""
+        # Consecutive flushes can never overtake each other, but the actions are published after releasing the
+        # pending lock: publishing can take long while Redis is reconnecting, and should not block sending actions
+        with self.__flush_lock:
+            with self.__pending_lock:
+                actions = self.__pending
+                self.__pending = []
+                self.__pending_event.clear()
+            self.__execute(actions)
 
     def stop(self):
-        """Stop listening to incoming events (which is done in a thread) so the Python application can close."""
+        """Stop listening to incoming events (which is done in a thread) so the Python application can close.
+        Waits (at most a few listen timeouts) for the listener thread to finish, unless called from that thread,
+        and then for the event functions that are still running."""
         self.__running = False
+        self.flush()
+        if self.trace is not None:
+            self.trace.close()
+        if self.__hub is not None:
+            self.__hub.unregister(self)
+        else:
+            if current_thread() is not self.__listener:
+                self.__listener.join(timeout=3 * self.listen_timeout)
+            if self.__dispatcher is not None:
+                self.__dispatcher.stop()
+            if self.__own_transport:
+                self.transport.close()
 
     def on_robot_event(self, event):
         """Triggered upon an event from the robot. This can be either an event related to some action called here,
@@ -75,13 +303,35 @@ class AbstractApplication(object):
 
     def on_person_detected(self):
         """Triggered when some person was detected in front of the robot (after a startWatching action was called).
-        Only sent when the people detection service is running. Will be sent as long as a person is detected."""
+        Only sent when the people detection service is running. Will be sent as long as a person is detected.
+        Not triggered when detected_person has a perception policy (see perception_policies)."""
         pass
 
     def on_face_recognized(self, identifier):
         """Triggered when a specific face was detected in front of the robot (after a startWatching action was called).
         Only sent when the face recognition service is running. Will be sent as long as the face is recognised.
-        The identifiers of recognised faces are stored in a file, and will thus persist over a restart of the agent."""
+        The identifiers of recognised faces are stored in a file, and will thus persist over a restart of the agent.
+        Not triggered when recognised_face has a perception policy (see perception_policies)."""
+        pass
+
+    def on_person_arrived(self):
+        """Triggered when a person is detected after none was, if detected_person has the ON_CHANGE policy
+        (see perception_policies)."""
+        pass
+
+    def on_person_left(self):
+        """Triggered when no person has been detected for a while after one was, if detected_person has the
+        ON_CHANGE policy (see perception_policies)."""
+        pass
+
+    def on_face_arrived(self, identifier):
+        """Triggered when the face with the given identifier is recognised while it was not, if recognised_face has
+        the ON_CHANGE policy (see perception_policies). Several faces can be present at the same time."""
+        pass
+
+    def on_face_left(self, identifier):
+        """Triggered when the face with the given identifier has not been recognised for a while, if recognised_face
+        has the ON_CHANGE policy (see perception_policies)."""
         pass
 
     def on_audio_language(self, languageKey):
@@ -141,8 +391,12 @@ class AbstractApplication(object):
         self.__send('audio_context', context)
 
     def set_audio_hints(self, args):
-        """Pass hints to Dialogflow about the words that it should recognize especially."""
-        self.__send('audio_hints', '|'.join(args))
+        """Pass hints to Dialogflow about the words that it should recognize especially.
+        The robot connector splits the hints on every '|', so any in a hint are replaced by a space."""
+        for hint in args:
+            if plain(str(hint)) != str(hint):
+                logger.warning('Audio hint {!r} contains a separator; sending it as {!r}', hint, plain(str(hint)))
+        self.__send('audio_hints', encode_hints(args))
 
     def start_listening(self):
         """Tell the robot (and Dialogflow) to start listening to audio (and potentially recording it).
@@ -179,10 +433,10 @@ class AbstractApplication(object):
     def say(self, text, emotion=None):
         """A string that the robot should say (in the currently selected language!).
         A TextStarted event will be sent when the speaking starts and a TextDone event after it is finished."""
-        logger.debug(f"Saying '{text}'")
+        logger.debug("Saying '{}'", text)
         if emotion is not None:
             text = add_emotion(text, emotion=emotion)
-            logger.debug(f"Saying '{text}'")
+            logger.debug("Saying '{}'", text)
         self.__send('action_say', text)
 
     def say_animated(self, text, emotion=None):
@@ -191,10 +445,10 @@ class AbstractApplication(object):
         Moreover, in this function, special tags are supported, please see:
         http://doc.aldebaran.com/2-5/naoqi/audio/altexttospeech-tuto.html#using-tags-for-voice-tuning
         A TextStarted event will be sent when the speaking starts and a TextDone event after it is finished."""
-        logger.debug(f"Saying (anim.) '{text}'")
+        logger.debug("Saying (anim.) '{}'", text)
         if emotion is not None:
             text = add_emotion(text, emotion=emotion)
-            logger.debug(f"Saying (anim.) '{text}'")
+            logger.debug("Saying (anim.) '{}'", text)
         self.__send('action_say_animated', text)
 
     def do_gesture(self, gesture):
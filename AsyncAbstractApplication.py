@@ -0,0 +1,99 @@
+import asyncio
+from collections import defaultdict, deque
+from threading import Lock
+from loguru import logger
+from AbstractApplication import AbstractApplication
+
+
+class AsyncAbstractApplication(AbstractApplication):
+    """Variant of the AbstractApplication in which every action that the robot confirms with an event is a coroutine.
+    Awaiting it sends the action and resolves (with the event) as soon as the matching completion event came in,
+    so independent actions can run concurrently, e.g.:
+        await asyncio.gather(self.set_eye_color('blue'), self.say('Hello!'))
+    Each action has a timeout (action_timeout by default), so a lost event raises an asyncio.TimeoutError
+    instead of blocking forever. Completion events that nobody is waiting for are simply ignored.
+    Within a batch(), the actions that are awaited are published as soon as all coroutines that are ready have
+    sent theirs (so those of a single gather still go out in one pipeline), instead of at the end of the batch,
+    which would never come as it waits for them."""
+
+    # Default number of seconds to wait for the completion event of an action
+    action_timeout = 30.0
+
+    def __init__(self, namespace=None, hub=None, trace=None, transport=None):
+        # Pending futures per event name (oldest first); set up before the listener thread is started
+        self.__waiters = defaultdict(deque)
+        self.__waiters_lock = Lock()
+        self.__loop = None
+        super().__init__(namespace=namespace, hub=hub, trace=trace, transport=transport)
+
+    def on_robot_event(self, event):
+        """Resolves the oldest action waiting for the given event. Make sure to call this when overriding it."""
+        with self.__waiters_lock:
+            waiters = self.__waiters.get(event)
+            future = waiters.popleft() if waiters else None
+        if future is not None:
+            self.__loop.call_soon_threadsafe(self.__resolve, future, event)
+
+    @staticmethod
+    def __resolve(future, event):
+        if not future.done():
+            future.set_result(event)
+
+    async def wait_for_event(self, event, timeout=None):
+        """Wait for the next robot event with the given name (e.g. 'FrontTactilTouched')."""
+        return await self.__perform(None, event, timeout)
+
+    async def __perform(self, action, event, timeout, *args, **kwargs):
+        self.__loop = asyncio.get_running_loop()
+        future = self.__loop.create_future()
+        # Register before sending, so that even an immediate completion event cannot be missed
+        with self.__waiters_lock:
+            self.__waiters[event].append(future)
+        if action is not None:
+            action(*args, **kwargs)
+            # Runs after the other coroutines that are ready now (e.g. of the same gather) sent their actions
+            self.__loop.call_soon(self._flush_batch)
+        try:
+            return await asyncio.wait_for(future, self.action_timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            with self.__waiters_lock:
+                if future in self.__waiters[event]:
+                    self.__waiters[event].remove(future)
+            logger.warning(f'Timed out waiting for {event}')
+            raise
+
+    ##
+    # Below are the awaitable versions of the action functions that are confirmed by a robot event.
+    ##
+
+    async def set_language(self, languageKey, timeout=None):
+        """See AbstractApplication.set_language; resolves on the LanguageChanged event."""
+        return await self.__perform(super().set_language, 'LanguageChanged', timeout, languageKey)
+
+    async def set_idle(self, timeout=None):
+        """See AbstractApplication.set_idle; resolves on the SetIdle event."""
+        return await self.__perform(super().set_idle, 'SetIdle', timeout)
+
+    async def set_non_idle(self, timeout=None):
+        """See AbstractApplication.set_non_idle; resolves on the SetNonIdle event."""
+        return await self.__perform(super().set_non_idle, 'SetNonIdle', timeout)
+
+    async def say(self, text, emotion=None, timeout=None):
+        """See AbstractApplication.say; resolves on the TextDone event."""
+        return await self.__perform(super().say, 'TextDone', timeout, text, emotion=emotion)
+
+    async def say_animated(self, text, emotion=None, timeout=None):
+        """See AbstractApplication.say_animated; resolves on the TextDone event."""
+        return await self.__perform(super().say_animated, 'TextDone', timeout, text, emotion=emotion)
+
+    async def do_gesture(self, gesture, timeout=None):
+        """See AbstractApplication.do_gesture; resolves on the GestureDone event."""
+        return await self.__perform(super().do_gesture, 'GestureDone', timeout, gesture)
+
+    async def play_audio(self, audioFile, timeout=None):
+        """See AbstractApplication.play_audio; resolves on the PlayAudioDone event."""
+        return await self.__perform(super().play_audio, 'PlayAudioDone', timeout, audioFile)
+
+    async def set_eye_color(self, colour, timeout=None):
+        """See AbstractApplication.set_eye_color; resolves on the EyeColourDone event."""
+        return await self.__perform(super().set_eye_color, 'EyeColourDone', timeout, colour)
@@ -0,0 +1,154 @@
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+Prosody = namedtuple('Prosody', ['duration', 'energy_db', 'energy_std', 'speaking_rate', 'pitch_hz', 'pitch_std',
+                                 'pause_ratio'])
+
+# PCM sample formats (format tag, bits per sample) and their numpy types
+SAMPLE_TYPES = {(1, 8): np.uint8, (1, 16): np.dtype('<i2'), (1, 32): np.dtype('<i4'), (3, 32): np.dtype('<f4')}
+
+
+def read_wav(path):
+    """Returns the samples of the first channel of a WAV file and its sample rate.
+    The samples are a view on a memory map of the file, so nothing is read until they are used."""
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise ValueError(f'{path} is not a WAV file')
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f'{path} has no data chunk')
+            name, size = chunk[:4], int.from_bytes(chunk[4:], 'little')
+            if name == b'fmt ':
+                fmt = f.read(size)
+            elif name == b'data':
+                offset = f.tell()
+                available = f.seek(0, 2) - offset
+                break
+            else:
+                f.seek(size + size % 2, 1)
+    if fmt is None:
+        raise ValueError(f'{path} has no format chunk')
+    tag, channels, rate = int.from_bytes(fmt[0:2], 'little'), int.from_bytes(fmt[2:4], 'little'), \
+        int.from_bytes(fmt[4:8], 'little')
+    bits = int.from_bytes(fmt[14:16], 'little')
+    if tag == 0xFFFE:  # WAVE_FORMAT_EXTENSIBLE: the actual format tag starts the sub format GUID
+        tag = int.from_bytes(fmt[24:26], 'little')
+    dtype = SAMPLE_TYPES.get((tag, bits))
+    if dtype is None:
+        raise ValueError(f'{path} has an unsupported sample format ({tag}, {bits} bits)')
+    # Recordings that are still being written (or were cut off) have fewer samples than their header says
+    frames = min(size, available) // (channels * np.dtype(dtype).itemsize)
+    if frames == 0:
+        return np.zeros(0, dtype=dtype), rate
+    samples = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(frames, channels))
+    return samples[:, 0], rate
+
+
+def frames_of(x, length, hop):
+    """Returns the overlapping frames of the (contiguous) signal as a (frames, length) view."""
+    count = 1 + (len(x) - length) // hop
+    return as_strided(x, shape=(count, length), strides=(hop * x.strides[0], x.strides[0]), writeable=False)
+
+
+def prosody(samples, rate, frame=0.025, hop=0.010):
+    """Computes prosodic features of a recorded answer, over frames of 25 ms every 10 ms (all at once):
+     - the mean and standard deviation of the energy (in dB) of the voiced frames,
+       i.e. those at least 10 dB above the noise floor (the 10th percentile);
+     - a speaking rate proxy: the number of syllable-like peaks of the (smoothed) energy per second;
+     - the median pitch (from the autocorrelation of the voiced frames) and its standard deviation in semitones;
+     - the fraction of frames that are pauses."""
+    length, step = int(frame * rate), int(hop * rate)
+    duration = len(samples) / rate if rate else 0.0
+    if len(samples) < length:
+        return Prosody(duration, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+    # Scaled to full scale (-1..1), so that the energy is in dBFS
+    x = np.asarray(samples, dtype=np.float32)
+    if samples.dtype == np.uint8:
+        x = (x - 128.0) / 128.0
+    elif samples.dtype.kind == 'i':
+        x /= float(np.iinfo(samples.dtype).max) + 1.0
+    frames = frames_of(x, length, step)
+    db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    voiced = db > np.percentile(db, 10) + 10.0
+    if not voiced.any():
+        return Prosody(duration, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+    # Syllable nuclei: local maxima of the smoothed energy that rise at least 3 dB above its minimum around them
+    envelope = np.convolve(db, np.ones(5) / 5, mode='same')
+    padded = np.pad(envelope, 7, mode='edge')
+    floor = frames_of(padded, 15, 1).min(axis=1)
+    peaks = ((envelope[1:-1] > envelope[:-2]) & (envelope[1:-1] >= envelope[2:]) & voiced[1:-1]
+             & (envelope[1:-1] - floor[1:-1] > 3.0))
+    # Pitch: the strongest autocorrelation lag between 2.5 ms (400 Hz) and half a frame, of the periodic frames
+    windowed = frames[voiced] * np.hanning(length).astype(np.float32)
+    spectrum = np.fft.rfft(windowed, n=2 * length, axis=1)
+    correlation = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, axis=1)[:, :length]
+    low, high = max(1, rate // 400), length // 2
+    lags = np.argmax(correlation[:, low:high], axis=1) + low
+    strength = correlation[np.arange(len(lags)), lags] / (correlation[:, 0] + 1e-10)
+    pitches = rate / lags[strength > 0.3]
+    if len(pitches):
+        pitch = float(np.median(pitches))
+        pitch_std = float(np.std(12 * np.log2(pitches / pitch)))
+    else:
+        pitch, pitch_std = 0.0, 0.0
+    return Prosody(duration, float(db[voiced].mean()), float(db[voiced].std()),
+                   float(peaks.sum() / duration), pitch, pitch_std, float(1.0 - voiced.mean()))
+
+
+def extract(path):
+    """Reads a WAV file and computes its Prosody (in a worker process of the AudioFeaturePipeline)."""
+    samples, rate = read_wav(path)
+    return prosody(samples, rate)
+
+
+def arousal(features, pitch_std_high=6.0, speaking_rate_high=6.0):
+    """A rough 0..1 measure of vocal arousal (which rises with stress): the average of the pitch variability
+    and the speaking rate, each relative to a value that counts as high."""
+    return (min(1.0, features.pitch_std / pitch_std_high) + min(1.0, features.speaking_rate / speaking_rate_high)) / 2
+
+
+class AudioFeaturePipeline(object):
+    """Computes the Prosody of recorded answers in a pool of worker processes, so that neither the dialogue
+    nor the event dispatching waits for it. submit() returns a concurrent.futures.Future of the features."""
+
+    # The pool is started once the application already runs threads (holding locks), so the workers must not be
+    # forked from it: they are forked from a clean server process instead (or spawned, where that is not available)
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.__executor = None
+        self.__lock = Lock()
+
+    def __pool(self):
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                      mp_context=multiprocessing.get_context(self.start_method))
+            return self.__executor
+
+    def warm_up(self):
+        """Starts the worker processes (which otherwise happens when the first file is submitted)."""
+        pool = self.__pool()
+        for future in [pool.submit(abs, 0) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, path):
+        return self.__pool().submit(extract, path)
+
+    def map(self, paths):
+        """Returns the Prosody of each of the files (in order), computed in parallel."""
+        return list(self.__pool().map(extract, paths, chunksize=max(1, len(paths) // (4 * self.workers))))
+
+    def stop(self):
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=False)
+                self.__executor = None
@@ -0,0 +1,2 @@
+"""Benchmarks for the Study Buddy application. Run them from the repository root with `python -m benchmarks.<name>`.
+Most of them need a Redis server on localhost."""
@@ -0,0 +1,107 @@
+"""Measures the throughput of the audio feature pipeline on a directory of WAV files.
+
+Without a directory, synthetic answers are generated: 'calm' ones (slow syllables with a steady pitch)
+and 'agitated' ones (fast syllables with a varying pitch), whose mean features are reported as well.
+Compares reading the files with the wave module (a copy of all samples) against the memory-mapped reader,
+and computing the features in-process against a pool of worker processes.
+Usage: python -m benchmarks.audio_bench [--dir WAVS] [--files N] [--workers 1 2 4]"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+import wave
+import numpy as np
+
+from audio_features import AudioFeaturePipeline, Prosody, arousal, extract, prosody, read_wav
+
+RATE = 16000
+
+
+def synthetic_answer(rng, seconds, syllables_per_second, pitch_spread):
+    """Harmonic 'syllables' of ~150 ms with a random pitch around 160 Hz, separated by short pauses and noise."""
+    t = np.arange(int(seconds * RATE)) / RATE
+    signal = rng.normal(0, 0.002, len(t))
+    start = 0.2
+    while start < seconds - 0.3:
+        length = rng.uniform(0.1, 0.2)
+        f0 = 160 * 2 ** (rng.normal(0, pitch_spread) / 12)
+        part = (t >= start) & (t < start + length)
+        phase = 2 * np.pi * f0 * (t[part] - start)
+        envelope = np.hanning(part.sum())
+        signal[part] += 0.3 * envelope * sum(np.sin(k * phase) / k for k in range(1, 6))
+        start += 1.0 / syllables_per_second * rng.uniform(0.8, 1.2)
+    return (np.clip(signal, -1, 1) * 32767).astype('<i2')
+
+
+def write_wav(path, samples):
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(samples.tobytes())
+
+
+def read_with_wave(path):
+    with wave.open(path, 'rb') as w:
+        return np.frombuffer(w.readframes(w.getnframes()), dtype='<i2'), w.getframerate()
+
+
+def generate(directory, count):
+    rng = np.random.RandomState(7)
+    kinds = {}
+    for i in range(count):
+        kind = 'calm' if i % 2 == 0 else 'agitated'
+        samples = synthetic_answer(rng, rng.uniform(3, 8), *((3.0, 1.0) if kind == 'calm' else (6.0, 5.0)))
+        path = os.path.join(directory, f'answer_{i:04d}.wav')
+        write_wav(path, samples)
+        kinds[path] = kind
+    return kinds
+
+
+def timed(label, paths, function):
+    start = time.perf_counter()
+    results = function(paths)
+    elapsed = time.perf_counter() - start
+    audio = sum(r.duration for r in results) if results and isinstance(results[0], Prosody) else None
+    extra = f' | {audio / elapsed:7.0f}x real time' if audio else ''
+    print(f'{label:>28}: {len(paths) / elapsed:8.1f} files/s{extra}')
+    return results
+
+
+def main(directory, files, workers):
+    with tempfile.TemporaryDirectory() as generated:
+        kinds = {}
+        if directory is None:
+            kinds = generate(generated, files)
+            directory = generated
+        paths = sorted(glob.glob(os.path.join(directory, '*.wav')))[:files]
+        megabytes = sum(os.path.getsize(p) for p in paths) / 1e6
+        print(f'{len(paths)} files ({megabytes:.1f} MB), {os.cpu_count()} CPUs')
+
+        timed('read (wave module)', paths, lambda ps: [read_with_wave(p)[0].sum() for p in ps])
+        timed('read (memory map)', paths, lambda ps: [read_wav(p)[0].sum() for p in ps])
+        timed('features (wave module)', paths, lambda ps: [prosody(*read_with_wave(p)) for p in ps])
+        results = timed('features (memory map)', paths, lambda ps: [extract(p) for p in ps])
+        for n in workers:
+            pipeline = AudioFeaturePipeline(workers=n)
+            pipeline.warm_up()
+            timed(f'features ({n} processes)', paths, pipeline.map)
+            pipeline.stop()
+
+        for kind in ('calm', 'agitated'):
+            selected = [r for p, r in zip(paths, results) if kinds.get(p) == kind]
+            if selected:
+                mean = Prosody(*np.mean(selected, axis=0))
+                print(f'{kind:>9}: rate {mean.speaking_rate:.1f}/s pitch {mean.pitch_hz:.0f}Hz '
+                      f'+-{mean.pitch_std:.1f} semitones, pauses {mean.pause_ratio:.0%}, '
+                      f'arousal {np.mean([arousal(r) for r in selected]):.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dir', help='directory with WAV files (default: generate synthetic answers)')
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+    main(args.dir, args.files, args.workers)
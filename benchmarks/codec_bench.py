@@ -0,0 +1,102 @@
+"""Measures the cost of receiving a message, from the raw Redis message up to the call of its event function.
+
+Compares the original receive path (decoding the channel and data of every message, and matching the topic with
+an if/elif chain) against AbstractApplication._receive (a lookup of the raw channel, and decoding only in the
+event function), on a stream that is dominated by continuously sent perception messages, as when the robot is
+looking. The event functions do nothing, and the handlers run inline (without dispatcher workers).
+Also compares decoding intents in the pipe format and in the versioned format.
+Needs a Redis server on localhost (for the connection of the application):
+python -m benchmarks.codec_bench [--messages N]"""
+import argparse
+import random
+import time
+
+from loguru import logger
+
+from AbstractApplication import AbstractApplication
+from codec import Intent
+from perception import PRESENCE
+
+TOPICS = AbstractApplication.topics
+# Share of each topic in the stream
+MIX = {'detected_person': 60, 'recognised_face': 20, 'events_robot': 15, 'audio_intent': 3, 'text_speech': 2}
+DATA = {'detected_person': '', 'recognised_face': 'student-42', 'events_robot': 'TextDone',
+        'audio_intent': 'time_left|6', 'text_speech': 'I have 6 hours left'}
+
+
+class SilentApp(AbstractApplication):
+    dispatch_workers = 0
+    collect_metrics = False
+
+
+class LegacyReceiver(object):
+    """The receive path as it was: everything decoded (and formatted for the debug log),
+    and the topic matched with an if/elif chain."""
+
+    def __init__(self, app, namespace):
+        self.app = app
+        self.namespace = namespace
+        self.prefix = len(f'{namespace}:')
+
+    def receive(self, message):
+        topic = message['channel'].decode()[self.prefix:]
+        data = message['data'].decode()
+        logger.debug(f"CHANNEL '{self.namespace}:{topic}': {data}")
+        app = self.app
+        if topic == TOPICS[0]:
+            app.on_robot_event(event=data)
+        elif topic == TOPICS[1]:
+            app.on_person_detected()
+        elif topic == TOPICS[2]:
+            app.on_face_recognized(identifier=data)
+        elif topic == TOPICS[3]:
+            app.on_audio_language(languageKey=data)
+        elif topic == TOPICS[4]:
+            data = data.split('|')
+            app.on_audio_intent(data[0], *data[1:])
+        elif topic == TOPICS[5]:
+            app.on_new_audio_file(audioFile=data)
+        elif topic == TOPICS[6]:
+            app.on_speech_text(text=data)
+        elif topic == TOPICS[7]:
+            app.on_new_picture_file(pictureFile=data)
+
+
+def stream(namespace, count):
+    rng = random.Random(3)
+    topics = rng.choices(list(MIX), weights=list(MIX.values()), k=count)
+    return [{'type': 'message', 'pattern': None, 'channel': f'{namespace}:{topic}'.encode(),
+             'data': DATA[topic].encode()} for topic in topics]
+
+
+def measure(label, receive, messages):
+    start = time.perf_counter()
+    for message in messages:
+        receive(message)
+    elapsed = time.perf_counter() - start
+    print(f'{label:>34}: {1e9 * elapsed / len(messages):6.0f} ns/message | {len(messages) / elapsed:9.0f} msg/s')
+
+
+def main(count):
+    logger.remove()
+    messages = stream('bench', count)
+    for policies in ({}, PRESENCE):
+        SilentApp.perception_policies = policies
+        app = SilentApp(namespace='bench')
+        legacy = LegacyReceiver(app, 'bench')
+        name = 'perception coalesced' if policies else 'no coalescing'
+        measure(f'legacy ({name})', legacy.receive, messages)
+        measure(f'codec ({name})', lambda m: app._receive(m['channel'], m['data']), messages)
+        app.stop()
+
+    payloads = [b'time_left|6'] * count
+    measure('intent pipe format', Intent.decode, payloads)
+    versioned = [Intent('time_left', ['6']).encode(version=2).encode()] * count
+    measure('intent versioned format', Intent.decode, versioned)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=200000)
+    args = parser.parse_args()
+    main(args.messages)
@@ -0,0 +1,79 @@
+"""Measures looking up what the robot says in the content index, and reloading it while it is being read.
+
+Compares a lookup in the prebuilt ContentSnapshot against the original lookup in the parsed configuration
+with add_emotion applied on every use. Then rewrites a copy of the configuration continuously (with an extra
+language and more quotes) while a reader keeps looking up texts, and reports the reload time and the
+worst lookup time during the reloads (which show whether readers ever wait for a reload).
+python -m benchmarks.content_bench [--lookups N] [--reloads N]"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from threading import Event, Thread
+
+from loguru import logger
+
+from content import ContentIndex
+from emotion_wrapper import add_emotion
+
+
+def timed(label, lookup, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        lookup()
+    elapsed = time.perf_counter() - start
+    print(f'{label:>28}: {1e9 * elapsed / count:6.0f} ns/lookup')
+
+
+def main(lookups, reloads):
+    logger.remove()
+    with open('config/config.json') as f:
+        config = json.load(f)
+    index = ContentIndex('config/config.json')
+    snapshot = index.snapshot
+    timed('config + add_emotion', lambda: add_emotion(config['questions']['time_left'], emotion='empathetic'),
+          lookups)
+    timed('prebuilt snapshot', lambda: snapshot.question('time_left', emotion='empathetic'), lookups)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'config.json')
+        shutil.copy('config/config.json', path)
+        index = ContentIndex(path)
+        stopped = Event()
+        worst = [0.0, 0]
+
+        def read():
+            while not stopped.is_set():
+                start = time.perf_counter()
+                index.snapshot.question('time_left', emotion='empathetic')
+                worst[0] = max(worst[0], time.perf_counter() - start)
+                worst[1] += 1
+
+        reader = Thread(target=read)
+        reader.start()
+        took = []
+        for i in range(reloads):
+            config['content'] = {'nl-NL': {'questions': {'time_left': f'Hoeveel uur heb je nog? ({i})'}}}
+            config['motivational_quotes'] = config['motivational_quotes'][:8] * (1 + i % 10)
+            with open(path + '.new', 'w') as f:
+                json.dump(config, f)
+            os.replace(path + '.new', path)
+            start = time.perf_counter()
+            index.reload()
+            took.append(time.perf_counter() - start)
+        stopped.set()
+        reader.join()
+        took.sort()
+        print(f'{"reload":>28}: p50 {1e3 * took[len(took) // 2]:.2f} ms  max {1e3 * took[-1]:.2f} ms '
+              f'(version {index.snapshot.version}, {index.snapshot.languages})')
+        print(f'{"lookups during reloads":>28}: {worst[1]} lookups, worst {1e6 * worst[0]:.0f} us')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lookups', type=int, default=200000)
+    parser.add_argument('--reloads', type=int, default=200)
+    args = parser.parse_args()
+    main(args.lookups, args.reloads)
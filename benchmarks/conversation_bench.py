@@ -0,0 +1,112 @@
+"""Drives complete StudyBuddyApp conversations against the RobotSimulator and reports turn latencies.
+
+Runs scripted anxious and non-anxious conversations and reports the latency percentiles of every question turn
+(by audio context) and of the whole conversation (from activation until the goodbye), and how long the robot
+is idle: from finishing a text until it starts the next one or starts listening ('after speech'), and from
+stopping to listen until it sends its reply ('after answer').
+The answers about the student's feelings are recorded (a synthetic recording of agitated or calm speech, which,
+unlike the recordings of a real robot, is a local file), so that their prosody is part of the anxiety check.
+All simulated delays are divided by the speed factor.
+Needs a Redis server on localhost: python -m benchmarks.conversation_bench [--runs N] [--speed X]"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+from loguru import logger
+
+from benchmarks.audio_bench import synthetic_answer, write_wav
+from benchmarks.listener_bench import percentile
+from robot_simulator import RobotSimulator
+from study_buddy import StudyBuddyApp
+
+SCRIPTS = {
+    'anxious': {
+        'activation': ['Hello study buddy'],
+        'students_feeling': ['I am feeling really stressed'],
+        'time_left': ['I have 6 hours left'],
+        'time_needed': ['About 3 hours'],
+    },
+    'not anxious': {
+        'activation': ['Hi buddy'],
+        'students_feeling': ['I am feeling great'],
+        'yes_no': ['Yes, please'],
+    },
+}
+# Speaking rate (syllables per second) and pitch spread (semitones) of the recorded answers
+VOICES = {'anxious': (6.0, 5.0), 'not anxious': (3.0, 1.0)}
+
+
+class TimedStudyBuddyApp(StudyBuddyApp):
+    """Records how long each turn takes, and stops after a single conversation."""
+
+    def __init__(self, **kwargs):
+        self.conversation = None
+        self.started = None
+        super().__init__(**kwargs)
+
+    def standby_loop(self):
+        if self.started is not None:
+            self.conversation = time.perf_counter() - self.started
+            self.running = False
+            return
+        super().standby_loop()
+        self.started = time.perf_counter()
+
+
+def idle_gaps(simulator):
+    """Returns the gaps after the robot finished speaking, and after it stopped listening (see above)."""
+    starts = sorted([t for t, channel, data in simulator.sent if data == 'TextStarted'] +
+                    [t for t, channel, data in simulator.received if data == 'start listening'])
+    says = [t for t, channel, _ in simulator.received if channel in ('action_say', 'action_say_animated')]
+    after_speech = [next(s for s in starts if s > t) - t for t, _, data in simulator.sent
+                    if data == 'TextDone' and any(s > t for s in starts)]
+    after_answer = [next(s for s in says if s > t) - t for t, _, data in simulator.received
+                    if data == 'stop listening' and any(s > t for s in says)]
+    return after_speech, after_answer
+
+
+def run(name, script, runs, speed, key_file, local_intents, recording):
+    turns = defaultdict(list)
+    conversations = []
+    for i in range(runs):
+        # The same motivational quotes in every comparison
+        random.seed(i)
+        simulator = RobotSimulator(script, speed=speed, recordings={'students_feeling': recording})
+        app = TimedStudyBuddyApp(key_file=key_file, profiles_db=':memory:')
+        app.record_answers = True
+        if not local_intents:
+            app.local_intent_confidence = float('inf')
+        app.main()
+        simulator.stop()
+        for context, durations in app.dialogue.turns.items():
+            turns[context] += durations
+        conversations.append(app.conversation)
+        after_speech, after_answer = idle_gaps(simulator)
+        turns['after speech'] += after_speech
+        turns['after answer'] += after_answer
+
+    print(f'{name} ({runs} runs, speed x{speed}, local intents {"on" if local_intents else "off"}):')
+    for context, durations in list(turns.items()) + [('conversation', conversations)]:
+        print(f'  {context:>18}: p50 {percentile(durations, 50):7.3f}s  p90 {percentile(durations, 90):7.3f}s  '
+              f'max {max(durations):7.3f}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--speed', type=float, default=10.0, help='factor by which the simulated robot is faster')
+    parser.add_argument('--no-local-intents', action='store_true', help='only use the (simulated) Dialogflow intents')
+    args = parser.parse_args()
+    logger.remove()
+    with tempfile.NamedTemporaryFile('w', suffix='.json') as key, tempfile.TemporaryDirectory() as recordings:
+        key.write('{}')
+        key.flush()
+        rng = np.random.RandomState(7)
+        for script_name, script in SCRIPTS.items():
+            recording = os.path.join(recordings, f'{script_name}.wav')
+            write_wav(recording, synthetic_answer(rng, 4.0, *VOICES[script_name]))
+            run(script_name, script, args.runs, args.speed, key.name, not args.no_local_intents, recording)
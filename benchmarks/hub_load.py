@@ -0,0 +1,92 @@
+"""Load test for hosting many robot sessions in one process, with a SessionHub or with a connection and listener each.
+
+Every simulated session receives namespaced robot events; the test reports throughput, the latency from publishing
+to the handler, misrouted messages, and the number of Redis connections and threads used.
+Needs a Redis server on localhost: python -m benchmarks.hub_load [--sessions N] [--messages N] [--standalone]"""
+import argparse
+import threading
+import time
+from threading import Event
+
+import redis
+from loguru import logger
+
+from AbstractApplication import AbstractApplication
+from benchmarks.listener_bench import percentile
+from session_hub import SessionHub
+
+
+class SimulatedSession(AbstractApplication):
+    def __init__(self, stats, namespace, hub=None):
+        self.stats = stats
+        super().__init__(namespace=namespace, hub=hub)
+
+    def on_robot_event(self, event):
+        namespace, sent = event.split(' ')
+        self.stats.record(namespace == self.namespace, time.perf_counter() - float(sent))
+
+
+class Stats(object):
+    def __init__(self, expected):
+        self.expected = expected
+        self.latencies = []
+        self.misrouted = 0
+        self.lock = threading.Lock()
+        self.done = Event()
+
+    def record(self, routed_correctly, latency):
+        with self.lock:
+            self.latencies.append(latency)
+            if not routed_correctly:
+                self.misrouted += 1
+            if len(self.latencies) == self.expected:
+                self.done.set()
+
+
+def run(sessions, messages, standalone):
+    control = redis.Redis()
+    clients_before = control.info('clients')['connected_clients']
+    threads_before = threading.active_count()
+
+    stats = Stats(messages)
+    hub = None if standalone else SessionHub()
+    apps = [SimulatedSession(stats, f'robot{i}', hub=hub) for i in range(sessions)]
+    time.sleep(0.5)  # let the subscriptions settle
+    clients = control.info('clients')['connected_clients'] - clients_before
+    threads = threading.active_count() - threads_before
+
+    start = time.perf_counter()
+    pipe = control.pipeline(transaction=False)
+    for i in range(messages):
+        namespace = f'robot{i % sessions}'
+        pipe.publish(f'{namespace}:events_robot', f'{namespace} {time.perf_counter()!r}')
+        if i % 100 == 99:
+            pipe.execute()
+    pipe.execute()
+    stats.done.wait(timeout=30)
+    elapsed = time.perf_counter() - start
+
+    if hub is not None:
+        hub.stop()
+    else:
+        for app in apps:
+            app.stop()
+
+    mode = 'standalone' if standalone else 'hub'
+    print(f'{mode:>10}: {sessions} sessions on {clients} Redis connections and {threads} threads | '
+          f'{len(stats.latencies)}/{messages} delivered, {stats.misrouted} misrouted | '
+          f'{len(stats.latencies) / elapsed:8.0f} msg/s | '
+          f'latency p50 {1e3 * percentile(stats.latencies, 50):6.2f}ms '
+          f'p99 {1e3 * percentile(stats.latencies, 99):6.2f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--standalone', action='store_true', help='also run without a hub, for comparison')
+    args = parser.parse_args()
+    logger.remove()
+    run(args.sessions, args.messages, standalone=False)
+    if args.standalone:
+        run(args.sessions, args.messages, standalone=True)
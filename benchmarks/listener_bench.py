@@ -0,0 +1,100 @@
+"""Compares the blocking listener of AbstractApplication against the old 1 ms busy-poll loop.
+
+Measures the CPU time used while idle and the latency from publishing an event to its handler being called.
+Needs a Redis server on localhost: python -m benchmarks.listener_bench [--idle SECONDS] [--messages N]"""
+import argparse
+import resource
+import time
+from threading import Thread, Event
+
+import redis
+from loguru import logger
+
+from AbstractApplication import AbstractApplication
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class LegacyPollingListener(object):
+    """The listener loop as it was: get_message() without a timeout and a 1 ms sleep when nothing arrived."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.pubsub = redis.Redis().pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe('events_robot')
+        self.running = True
+        self.thread = Thread(target=self.listen)
+        self.thread.start()
+
+    def listen(self):
+        while self.running:
+            message = self.pubsub.get_message()
+            if message is not None:
+                self.handler(message['data'].decode())
+            else:
+                time.sleep(0.001)
+        self.pubsub.close()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+
+class TimedApplication(AbstractApplication):
+    def __init__(self, handler):
+        self.handler = handler
+        super().__init__()
+
+    def on_robot_event(self, event):
+        self.handler(event)
+
+
+def measure(name, factory, idle_seconds, messages):
+    latencies = []
+    received = Event()
+
+    def handler(data):
+        latencies.append(time.perf_counter() - float(data))
+        if len(latencies) == messages:
+            received.set()
+
+    listener = factory(handler)
+    time.sleep(0.5)  # let the subscription settle
+
+    start_cpu, start_wall = cpu_seconds(), time.perf_counter()
+    time.sleep(idle_seconds)
+    idle_cpu = (cpu_seconds() - start_cpu) / (time.perf_counter() - start_wall)
+
+    publisher = redis.Redis()
+    for _ in range(messages):
+        publisher.publish('events_robot', repr(time.perf_counter()))
+        time.sleep(0.005)  # spaced out, so that we measure wake-up latency and not queueing
+    received.wait(timeout=10)
+
+    shutdown_start = time.perf_counter()
+    listener.stop()
+    shutdown = time.perf_counter() - shutdown_start
+
+    print(f'{name:>10}: idle CPU {100 * idle_cpu:6.2f}% of a core | '
+          f'latency p50 {1e6 * percentile(latencies, 50):7.1f}us '
+          f'p90 {1e6 * percentile(latencies, 90):7.1f}us '
+          f'p99 {1e6 * percentile(latencies, 99):7.1f}us | '
+          f'stop() {1e3 * shutdown:6.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--idle', type=float, default=5.0, help='seconds to measure idle CPU use over')
+    parser.add_argument('--messages', type=int, default=500, help='number of events to measure latency with')
+    args = parser.parse_args()
+    logger.remove()
+    measure('poll', LegacyPollingListener, args.idle, args.messages)
+    measure('blocking', TimedApplication, args.idle, args.messages)
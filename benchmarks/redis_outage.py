@@ -0,0 +1,149 @@
+"""Kills and restarts Redis in the middle of StudyBuddyApp conversations with the RobotSimulator.
+
+Starts a Redis server of its own (so the one on localhost is left alone) that listens on a TCP port and a Unix
+socket. First compares the round trip from publishing a message until a subscriber got it over both. Then runs
+scripted conversations over the Unix socket, killing Redis (SIGKILL) at a random moment of every conversation and
+restarting it after --outage seconds. Reports how many conversations still finished, how long they took compared to
+an undisturbed one, and the reconnect latencies of the application and the simulator (see transport.Transport):
+until resubscribed, both in total and after the restart, and until a publish that was retried went out.
+A message that is published while its subscriber is still disconnected is lost (e.g. a TextDone event), which can
+leave a conversation waiting forever; such a conversation is given up after --patience seconds.
+Needs redis-server on the PATH: python -m benchmarks.redis_outage [--runs N] [--speed X] [--outage S]"""
+import argparse
+import os
+import random
+import subprocess
+import tempfile
+import time
+from threading import Event, Thread
+
+import redis
+from loguru import logger
+
+from benchmarks.conversation_bench import SCRIPTS, TimedStudyBuddyApp
+from benchmarks.listener_bench import percentile
+from robot_simulator import RobotSimulator
+from transport import Transport
+
+
+class RedisServer(object):
+    """A throwaway Redis server without persistence."""
+
+    def __init__(self, directory, port):
+        self.port = port
+        self.socket = os.path.join(directory, 'redis.sock')
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(['redis-server', '--port', str(self.port), '--unixsocket', self.socket,
+                                         '--save', '', '--appendonly', 'no'], stdout=subprocess.DEVNULL)
+        # A killed server leaves its socket file behind
+        client = redis.Redis(port=self.port)
+        while True:
+            try:
+                client.ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.01)
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+
+def round_trips(label, transport, count=2000):
+    subscription = transport.subscribe(['bench'])
+    rtts = []
+    for i in range(count):
+        start = time.perf_counter()
+        transport.publish('bench', str(i))
+        while subscription.get_message(timeout=1.0) is None:
+            pass
+        rtts.append(time.perf_counter() - start)
+    subscription.close()
+    transport.close()
+    print(f'{label:>22}: publish -> subscriber p50 {1e6 * percentile(rtts, 50):5.0f}us  '
+          f'p99 {1e6 * percentile(rtts, 99):5.0f}us')
+
+
+def conversation(server, speed, key_file, patience, outage=None):
+    """Runs one conversation; with an outage (kill_after, down), kills Redis after kill_after seconds and restarts
+    it after down seconds. Returns the app and simulator, and whether the conversation finished."""
+    simulator = RobotSimulator(SCRIPTS['anxious'], speed=speed, unix_socket_path=server.socket)
+    app = TimedStudyBuddyApp(key_file=key_file, transport={'unix_socket_path': server.socket}, profiles_db=':memory:')
+    finished = Event()
+
+    def run():
+        app.main()
+        finished.set()
+    Thread(target=run, daemon=True).start()
+    if outage is not None:
+        kill_after, down = outage
+        if not finished.wait(kill_after):
+            server.kill()
+            time.sleep(down)
+            server.start()
+    finished.wait(patience)
+    if not finished.is_set():
+        app.stop()
+    simulator.stop()
+    return app, simulator, finished.is_set()
+
+
+def main(runs, speed, outage, patience, port):
+    with tempfile.TemporaryDirectory() as directory, tempfile.NamedTemporaryFile('w', suffix='.json') as key:
+        key.write('{}')
+        key.flush()
+        server = RedisServer(directory, port)
+        server.start()
+        try:
+            round_trips(f'TCP localhost:{port}', Transport(port=port))
+            round_trips('Unix socket', Transport(unix_socket_path=server.socket))
+
+            app, _, _ = conversation(server, speed, key.name, patience)
+            undisturbed = app.conversation
+            print(f'Undisturbed conversation: {undisturbed:.2f}s')
+            rng = random.Random(3)
+            durations, failed = [], 0
+            resubscribed, after_restart, published = [], [], []
+            for i in range(runs):
+                random.seed(i)
+                kill_after = rng.uniform(0.5, 0.9 * undisturbed)
+                app, simulator, finished = conversation(server, speed, key.name, patience, (kill_after, outage))
+                if finished:
+                    durations.append(app.conversation)
+                else:
+                    failed += 1
+                for transport in (app.transport, simulator.transport):
+                    resubscribe = transport.latencies['redis resubscribe']
+                    if resubscribe.count:
+                        resubscribed.append(resubscribe.max)
+                        after_restart.append(resubscribe.max - outage)
+                    if transport.latencies['redis publish'].count:
+                        published.append(transport.latencies['redis publish'].max)
+                print(f'  run {i}: Redis killed after {kill_after:5.2f}s, '
+                      f'{"finished in %.2fs" % app.conversation if finished else "did not finish"}')
+        finally:
+            server.kill()
+        print(f'{runs - failed}/{runs} conversations finished with a {outage:.1f}s outage', end='')
+        if durations:
+            print(f', taking p50 {percentile(durations, 50):.2f}s  max {max(durations):.2f}s '
+                  f'(undisturbed {undisturbed:.2f}s)')
+        for label, latencies in (('resubscribed', resubscribed), ('after the restart', after_restart),
+                                 ('retried publish', published)):
+            if latencies:
+                print(f'{label:>22}: p50 {1e3 * percentile(latencies, 50):6.0f}ms  '
+                      f'max {1e3 * max(latencies):6.0f}ms  (n={len(latencies)})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--speed', type=float, default=2.0, help='factor by which the simulated robot is faster')
+    parser.add_argument('--outage', type=float, default=1.0, help='seconds that Redis is down')
+    parser.add_argument('--patience', type=float, default=60.0,
+                        help='seconds after which a conversation that did not finish is given up')
+    parser.add_argument('--port', type=int, default=6390, help='TCP port of the test Redis server')
+    args = parser.parse_args()
+    logger.remove()
+    main(args.runs, args.speed, args.outage, args.patience, args.port)
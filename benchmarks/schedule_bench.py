@@ -0,0 +1,59 @@
+"""Compares the Schedule engine with the original make_schedule loop for horizons from 3 hours to 30 days.
+
+For every horizon it reports the time of the original loop (which built every entry, then kept 8), of building
+a Schedule and reading its first page, of listing all of its entries, and of replanning it halfway.
+Run with: python -m benchmarks.schedule_bench"""
+import timeit
+
+from loguru import logger
+
+from scheduler import Schedule, stringify_time
+
+HORIZONS = {'3 hours': 3, '12 hours': 12, '1 day': 24, '3 days': 72, '7 days': 168, '14 days': 336, '30 days': 720}
+
+
+def legacy_make_schedule(time_est, time_remaining, start_hour):
+    """The original implementation, which ignored time_est."""
+    bins = int(2 * time_remaining)
+    bin_assignments = []
+    time_stamp = float(start_hour)
+    last_activity = None
+    for i in range(bins):
+        btype = 'revise'
+        if i % 3 == 0:
+            btype = 'take a break'
+        if i % 6 == 0 and time_stamp < 22:
+            btype = 'have a snack'
+        if i % 12 == 0:
+            btype = 'get some exercise'
+        if i == 0:
+            btype = 'revise'
+        if time_stamp < 7.0:
+            btype = 'get some sleep'
+        if btype != last_activity:
+            bin_start = stringify_time(time_stamp)
+            bin_assignments.append(f'At {bin_start}, {btype}')
+        last_activity = btype
+        time_stamp += 0.5
+        if time_stamp > 24.0:
+            time_stamp -= 24.0
+    if len(bin_assignments) > 8:
+        return bin_assignments[:8]
+    return bin_assignments
+
+
+def per_call(fn, number=200):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number
+
+
+if __name__ == '__main__':
+    logger.remove()
+    print(f"{'horizon':>10} {'legacy':>10} {'first page':>12} {'all entries':>12} {'replan':>10}")
+    for name, hours in HORIZONS.items():
+        work = hours / 6
+        legacy = per_call(lambda: legacy_make_schedule(work, hours, 9.0))
+        first = per_call(lambda: Schedule(work, hours, start_hour=9.0).page(0))
+        everything = per_call(lambda: Schedule(work, hours, start_hour=9.0).entries())
+        schedule = Schedule(work, hours, start_hour=9.0)
+        replan = per_call(lambda: schedule.replan(work / 4, hours / 2))
+        print(f'{name:>10} {1e6 * legacy:8.1f}us {1e6 * first:10.1f}us {1e6 * everything:10.1f}us {1e6 * replan:8.1f}us')
@@ -0,0 +1,60 @@
+"""Compares the SentimentEngine with the plain TextBlob(text).sentiment path that student_is_anxious used before.
+
+Reports the cold latency (fresh interpreter: import plus first answer) of both, the warm latency per utterance
+(uncached and cached), the throughput of score_many, and checks that all scores are identical.
+Run with: python -m benchmarks.sentiment_bench"""
+import subprocess
+import sys
+import time
+
+ANSWERS = [
+    "I'm fine", 'I am feeling a bit stressed', 'Scared', 'not so good to be honest', 'I am really happy today',
+    "I'm worried about my exam tomorrow", 'great', 'I feel anxious', 'Pretty good thanks', 'not sure',
+    "I'm okay I guess", 'terrible', 'I am content', 'a little nervous', "I'm looking forward to it",
+]
+
+COLD = {
+    'textblob': 'from textblob import TextBlob; TextBlob({answer!r}).sentiment',
+    'engine (no warm-up)': 'from sentiment import SentimentEngine; SentimentEngine().score({answer!r})',
+}
+
+
+def cold_latency(statement):
+    """Runs the statement in a fresh interpreter and returns how long it took (excluding the interpreter start)."""
+    code = f'import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def per_call(fn, texts, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            fn(text)
+    return (time.perf_counter() - start) / (repeat * len(texts))
+
+
+if __name__ == '__main__':
+    from loguru import logger
+    logger.remove()
+    for name, statement in COLD.items():
+        print(f'cold {name:>20}: {1e3 * cold_latency(statement.format(answer=ANSWERS[1])):8.1f}ms')
+
+    from textblob import TextBlob
+    from sentiment import SentimentEngine
+    engine = SentimentEngine()
+    start = time.perf_counter()
+    engine.warm_up()
+    print(f'warm-up (import excluded): {1e3 * (time.perf_counter() - start):8.1f}ms')
+
+    textblob_scores = [tuple(TextBlob(answer).sentiment) for answer in ANSWERS]
+    engine_scores = [tuple(score) for score in engine.score_many(ANSWERS)]
+    print(f'identical scores: {textblob_scores == engine_scores}')
+
+    print(f'warm textblob          : {1e6 * per_call(lambda t: TextBlob(t).sentiment, ANSWERS):8.1f}us/answer')
+    print(f'warm engine (uncached) : {1e6 * per_call(SentimentEngine(cache_size=0).score, ANSWERS):8.1f}us/answer')
+    print(f'warm engine (cached)   : {1e6 * per_call(engine.score, ANSWERS):8.1f}us/answer')
+    transcript = ANSWERS * 200
+    start = time.perf_counter()
+    engine.score_many(transcript)
+    print(f'score_many             : {len(transcript) / (time.perf_counter() - start):8.0f} answers/s')
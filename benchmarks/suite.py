@@ -0,0 +1,301 @@
+"""Microbenchmarks of the hot paths, with machine-readable baselines and regression checks.
+
+Covers the listener (throughput in messages/s, with the handlers inline, and the latency from publishing an event
+until its handler runs, with the dispatcher), publishing actions (one by one and batched), schedule generation for
+several horizons, stringify_time, add_emotion, sentiment scoring (cold in a fresh interpreter, warm uncached and
+cached) and StudyBuddyApp.student_is_anxious (on answers that were not scored before).
+Redis is either an in-process fake (the default, which needs fakeredis: pip install fakeredis)
+or the Redis server on localhost (--redis local). The fake polls its subscriptions every 10 ms, so the listener
+latency is only comparable between results with the same kind of Redis.
+All benchmarks are run --repeats times (in a different order every round, after --warmup rounds that are not
+counted), and every result is the median of its repeats; the spread of the repeats is kept as its noise.
+Results can be saved as a JSON baseline (--save), and compared with one (--compare): a benchmark whose median got
+worse by more than it is allowed to is reported, and makes the exit status 1. It is allowed the larger of its
+threshold (--threshold, or its own in THRESHOLDS) and NOISE_FACTOR times the combined noise of both runs, so that
+a benchmark that is noisy on this machine is not reported for a change that is within its noise.
+Usage: python -m benchmarks.suite [--redis fake|local] [--only NAME ...] [--repeats N] [--warmup N] [--save FILE]
+                                  [--compare FILE]"""
+import argparse
+import itertools
+import json
+import math
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from threading import Condition
+
+import redis
+from loguru import logger
+
+from AbstractApplication import AbstractApplication
+from benchmarks.listener_bench import percentile
+from benchmarks.sentiment_bench import ANSWERS, cold_latency
+from emotion_wrapper import add_emotion
+from scheduler import make_schedule, stringify_time
+from sentiment import SentimentEngine
+from transport import Transport
+
+# A measurement, and whether a higher value is better (e.g. throughput) or worse (e.g. latency);
+# a result of several repeats is their median, and has all of them as samples
+Result = namedtuple('Result', ['value', 'unit', 'higher_is_better', 'samples'], defaults=[()])
+
+HORIZONS = {'3h': 3, '1d': 24, '7d': 168, '30d': 720}
+# Allowed relative change for the (noisier) benchmarks that should not use the default threshold
+THRESHOLDS = {'listener.latency_p99': 1.0, 'sentiment.cold': 0.5, 'actions.publish': 0.4}
+# How many times its (relative) noise a result may change before it counts as a regression
+NOISE_FACTOR = 3.0
+
+
+def connect(kind):
+    """Returns a function that creates a Redis client: all of its clients share one server."""
+    if kind == 'local':
+        return redis.Redis
+    import fakeredis
+    server = fakeredis.FakeServer()
+    return lambda: fakeredis.FakeStrictRedis(server=server)
+
+
+def per_call(function, seconds=0.3):
+    """The time of a single call, from as many calls as fit (about) in the given time (the best of 3 rounds)."""
+    count = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(count):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds / 10:
+            break
+        count *= 2
+    count = max(1, int(count * seconds / 10 / elapsed))
+    best = elapsed / count
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(count):
+            function()
+        best = min(best, (time.perf_counter() - start) / count)
+    return best
+
+
+class CountingApp(AbstractApplication):
+    """Counts the robot events it receives, and records how long after their sending it did."""
+    collect_metrics = False
+
+    def __init__(self, client, dispatch_workers):
+        self.dispatch_workers = dispatch_workers
+        self.received = 0
+        self.latencies = []
+        self.received_cond = Condition()
+        super().__init__(transport=Transport(client=client))
+
+    def on_robot_event(self, event):
+        if event != 'x':
+            self.latencies.append(time.perf_counter() - float(event))
+        with self.received_cond:
+            self.received += 1
+            self.received_cond.notify_all()
+
+    def wait_for(self, count, timeout=30):
+        with self.received_cond:
+            return self.received_cond.wait_for(lambda: self.received >= count, timeout=timeout)
+
+    def stop(self):
+        super().stop()
+        # An application leaves a given transport open; connections that are left to the garbage collector can
+        # deadlock fakeredis (closing one takes the lock of the server, which it may hold already, e.g. while
+        # publishing to the subscribers when the connection of one of them is collected)
+        self.transport.close()
+
+
+def bench_listener(client, messages=20000, latency_messages=300):
+    app = CountingApp(client(), dispatch_workers=0)
+    publisher = client()
+    time.sleep(0.2)  # let the subscription settle
+    start = time.perf_counter()
+    for i in range(0, messages, 1000):
+        pipe = publisher.pipeline(transaction=False)
+        for _ in range(min(1000, messages - i)):
+            pipe.publish('events_robot', 'x')
+        pipe.execute()
+    app.wait_for(messages)
+    throughput = messages / (time.perf_counter() - start)
+    app.stop()
+
+    app = CountingApp(client(), dispatch_workers=AbstractApplication.dispatch_workers)
+    time.sleep(0.2)
+    for i in range(latency_messages):
+        publisher.publish('events_robot', repr(time.perf_counter()))
+        app.wait_for(i + 1)
+    app.stop()
+    publisher.connection_pool.disconnect()
+    return {
+        'listener.throughput': Result(throughput, 'msg/s', True),
+        'listener.latency_p50': Result(1e6 * percentile(app.latencies, 50), 'us', False),
+        'listener.latency_p99': Result(1e6 * percentile(app.latencies, 99), 'us', False),
+    }
+
+
+def bench_actions(client, actions=5000):
+    app = CountingApp(client(), dispatch_workers=0)
+    start = time.perf_counter()
+    for _ in range(actions):
+        app.say('Hello')
+    single = actions / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(actions // 10):
+        with app.batch():
+            for _ in range(10):
+                app.say('Hello')
+    batched = actions / (time.perf_counter() - start)
+    app.stop()
+    return {'actions.publish': Result(single, 'actions/s', True),
+            'actions.batched': Result(batched, 'actions/s', True)}
+
+
+def bench_schedule(client):
+    results = {f'schedule.{name}': Result(1e6 * per_call(lambda: make_schedule(hours / 6, hours, 9.0)), 'us', False)
+               for name, hours in HORIZONS.items()}
+    results['schedule.stringify_time'] = Result(1e9 * per_call(lambda: stringify_time(13.5)), 'ns', False)
+    return results
+
+
+def bench_emotion(client):
+    return {'emotion.add_emotion': Result(1e9 * per_call(lambda: add_emotion(ANSWERS[1], 'empathetic')), 'ns',
+                                          False)}
+
+
+def bench_sentiment(client):
+    cold = cold_latency(f'from sentiment import SentimentEngine; SentimentEngine().score({ANSWERS[1]!r})')
+    uncached = SentimentEngine(cache_size=0)
+    uncached.warm_up()
+    cached = SentimentEngine()
+    cached.score_many(ANSWERS)
+    answers = iter(ANSWERS * 100000)
+    return {
+        'sentiment.cold': Result(1e3 * cold, 'ms', False),
+        'sentiment.warm': Result(1e6 * per_call(lambda: uncached.score(next(answers))), 'us', False),
+        'sentiment.cached': Result(1e6 * per_call(lambda: cached.score(next(answers))), 'us', False),
+    }
+
+
+def bench_anxiety(client):
+    from study_buddy import StudyBuddyApp
+    with tempfile.NamedTemporaryFile('w', suffix='.json') as key:
+        key.write('{}')
+        key.flush()
+        app = StudyBuddyApp(key_file=key.name, transport=Transport(client=client()), profiles_db=':memory:')
+    # Without recorded answers (so without waiting for their prosody), and never the same answer twice
+    app.record_answers = False
+    app.sentiment.warm_up()
+    answers = (f'{answer} {i}' for i, answer in enumerate(itertools.cycle(ANSWERS)))
+
+    def check():
+        app.student_feeling = [next(answers)]
+        app.student_is_anxious()
+    logger.disable('study_buddy')
+    result = Result(1e6 * per_call(check), 'us', False)
+    logger.enable('study_buddy')
+    app.stop()
+    app.transport.close()
+    return {'anxiety.student_is_anxious': result}
+
+
+BENCHMARKS = {
+    'listener': bench_listener,
+    'actions': bench_actions,
+    'schedule': bench_schedule,
+    'emotion': bench_emotion,
+    'sentiment': bench_sentiment,
+    'anxiety': bench_anxiety,
+}
+
+
+def noise(samples):
+    """The relative spread of the repeats of a result (the median absolute deviation, scaled to estimate the
+    standard deviation), or 0 for a single one."""
+    if len(samples) < 2:
+        return 0.0
+    median = statistics.median(samples)
+    if not median:
+        return 0.0
+    return 1.4826 * statistics.median(abs(sample - median) for sample in samples) / abs(median)
+
+
+def run(names, client, repeats, warmup, rng):
+    """Runs the benchmarks repeats times (after the warm-up rounds), each round in another order;
+    returns the median result of each, with all of its repeats as samples."""
+    samples = defaultdict(list)
+    kinds = {}
+    for i in range(warmup + repeats):
+        order = list(names)
+        rng.shuffle(order)
+        for name in order:
+            for metric, result in BENCHMARKS[name](client).items():
+                if i >= warmup:
+                    samples[metric].append(result.value)
+                    kinds[metric] = result
+    return {metric: Result(statistics.median(samples[metric]), result.unit, result.higher_is_better,
+                           tuple(samples[metric]))
+            for metric, result in sorted(kinds.items())}
+
+
+def compare(results, baseline, threshold):
+    """Prints the change of every result against the baseline; returns the names of the regressed ones."""
+    regressed = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None or not before['value']:
+            continue
+        change = (result.value - before['value']) / before['value']
+        worse = -change if result.higher_is_better else change
+        allowed = max(THRESHOLDS.get(name, threshold),
+                      NOISE_FACTOR * math.hypot(noise(result.samples), noise(before.get('samples', ()))))
+        status = 'REGRESSED' if worse > allowed else ('improved' if worse < -allowed else 'ok')
+        if worse > allowed:
+            regressed.append(name)
+        print(f'{name:>28}: {before["value"]:12.1f} -> {result.value:12.1f} {result.unit:<9} '
+              f'{100 * change:+6.1f}% (allowed {100 * allowed:4.0f}%)  {status}')
+    return regressed
+
+
+def main(args):
+    logger.remove()
+    client = connect(args.redis)
+    results = run(args.only or list(BENCHMARKS), client, args.repeats, args.warmup, random.Random(args.seed))
+    for metric, result in results.items():
+        print(f'{metric:>28}: {result.value:12.1f} {result.unit:<9} +-{100 * noise(result.samples):4.1f}%')
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'time': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                       'redis': args.redis, 'repeats': args.repeats,
+                       'results': {name: result._asdict() for name, result in results.items()}},
+                      f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} ({baseline['time']}, {baseline['redis']} Redis):")
+        if baseline['redis'] != args.redis:
+            logger.warning(f"The baseline used {baseline['redis']} Redis instead of {args.redis}")
+        regressed = compare(results, baseline['results'], args.threshold)
+        if regressed:
+            print(f'Regressions: {", ".join(regressed)}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--redis', choices=['fake', 'local'], default='fake')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS))
+    parser.add_argument('--repeats', type=int, default=5, help='rounds of which the median is taken (default 5)')
+    parser.add_argument('--warmup', type=int, default=1, help='rounds that are run first, but not counted (default 1)')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the order of the benchmarks in each round')
+    parser.add_argument('--save', metavar='FILE', help='save the results as a baseline (JSON)')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative change that counts as a regression (default 0.25)')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,99 @@
+"""Measures how quickly and reliably StudyBuddyApp wakes up when a wake phrase is said while it is in standby.
+
+Compares the original standby loop (which restarted listening every 3 seconds, and was activated by any
+activation intent) against continuous standby listening with local wake phrase detection. In every trial a wake
+phrase is said at a random moment to the RobotSimulator, which only hears the words that are said while its speech
+stream is open, and sends interim results. Reports the latency from the end of the phrase until the activation
+(negative when a partial phrase was enough), and the share of phrases that did not activate the robot at all
+(within --patience seconds).
+Needs a Redis server on localhost: python -m benchmarks.wake_bench [--trials N]"""
+import argparse
+import random
+import tempfile
+import time
+from threading import Thread
+
+from loguru import logger
+
+from benchmarks.listener_bench import percentile
+from robot_simulator import RobotSimulator
+from study_buddy import StudyBuddyApp
+
+PHRASES = ['Hello study buddy', 'Hi buddy', 'Hey study buddy', 'Hi study buddy']
+
+
+class TimedStandbyApp(StudyBuddyApp):
+    """Records when it was activated."""
+    activated_at = None
+
+    def handle_intent(self, intent_name, *args):
+        if intent_name == 'activation' and self.activated_at is None:
+            self.activated_at = time.monotonic()
+        super().handle_intent(intent_name, *args)
+
+
+class LegacyStandbyApp(TimedStandbyApp):
+    """The standby loop as it was: listening restarted every 3 seconds, and the local intent matcher used for every
+    recognised text (in the activation context as well)."""
+
+    def standby_loop(self):
+        self.activation = False
+        while self.running and not self.activation:
+            with self.batch():
+                self.set_audio_context('activation')
+                self.start_listening()
+            self.intent_lock.acquire(timeout=3)
+            self.stop_listening()
+
+    def on_speech_text(self, text):
+        matcher = self.intent_matcher
+        if matcher is None or self.answered_locally:
+            return
+        match = matcher.match(text, context=self.audio_context)
+        if match is not None and match.confidence >= self.local_intent_confidence:
+            self.answered_locally = True
+            self.handle_intent(match.intent, *match.params)
+
+
+def run(name, app_class, trials, patience, key_file):
+    rng = random.Random(11)
+    simulator = RobotSimulator()
+    app = app_class(key_file=key_file, profiles_db=':memory:')
+    while app.intent_matcher is None:
+        time.sleep(0.05)
+    app.running = True
+    latencies = []
+    missed = 0
+    for _ in range(trials):
+        app.activated_at = None
+        standby = Thread(target=app.standby_loop)
+        standby.start()
+        time.sleep(rng.uniform(0.5, 3.5))
+        end = simulator.hear(rng.choice(PHRASES))
+        standby.join(timeout=end - time.monotonic() + patience)
+        if standby.is_alive():
+            missed += 1
+            app.handle_intent('activation')
+            standby.join()
+        else:
+            latencies.append(app.activated_at - end)
+        # Let the intents that are still on their way arrive before the next trial
+        time.sleep(1.0)
+    app.stop()
+    simulator.stop()
+    actions = sum(1 for _, channel, _ in simulator.received if channel == 'action_audio')
+    print(f'{name:>22}: latency p50 {percentile(latencies, 50):6.3f}s  p90 {percentile(latencies, 90):6.3f}s  '
+          f'missed {missed}/{trials} ({missed / trials:.0%})  listening actions {actions}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--trials', type=int, default=20)
+    parser.add_argument('--patience', type=float, default=3.0)
+    args = parser.parse_args()
+    logger.remove()
+    with tempfile.NamedTemporaryFile('w', suffix='.json') as key:
+        key.write('{}')
+        key.flush()
+        run('restarting every 3s', LegacyStandbyApp, args.trials, args.patience, key.name)
+        run('continuous listening', TimedStandbyApp, args.trials, args.patience, key.name)
@@ -0,0 +1,94 @@
+"""Decoding and encoding of the payloads on the Redis channels.
+
+Payloads arrive as raw bytes and are only decoded by the handler of their topic (so never for topics without one,
+or messages that are coalesced away). Intents and audio hints have two formats:
+ - version 1, the original: the values joined by '|' (e.g. 'time_left|6');
+ - version 2: a JSON object with a version field (e.g. '{"v":2,"intent":"time_left","params":["6"]}').
+Both formats are always understood here. Encoding uses version 1, unless version 2 is asked for.
+In version 1, a '|' or '\\' within an intent value is escaped with a '\\' (e.g. 'a\\|b' for the single value 'a|b'),
+but only the decoders in this module undo that: other receivers (e.g. the robot connector) just split on every '|'.
+Audio hints go to the robot connector, so they are sent without these characters instead (see plain)."""
+import json
+from collections import namedtuple
+
+SEPARATOR = '|'
+ESCAPE = '\\'
+VERSION = 2
+
+
+def text(data):
+    """Decodes a raw payload (or passes on one that was already decoded)."""
+    return data.decode() if isinstance(data, bytes) else data
+
+
+def escape(value):
+    return value.replace(ESCAPE, ESCAPE + ESCAPE).replace(SEPARATOR, ESCAPE + SEPARATOR)
+
+
+def plain(value):
+    """Replaces the characters that a receiver which is not escape-aware would misread by spaces."""
+    return value.replace(ESCAPE, ' ').replace(SEPARATOR, ' ')
+
+
+def split_values(payload):
+    """Splits a version 1 payload on the separators that are not escaped, and unescapes the values."""
+    if ESCAPE not in payload:
+        return payload.split(SEPARATOR)
+    values, value, escaped = [], [], False
+    for char in payload:
+        if escaped:
+            value.append(char)
+            escaped = False
+        elif char == ESCAPE:
+            escaped = True
+        elif char == SEPARATOR:
+            values.append(''.join(value))
+            value = []
+        else:
+            value.append(char)
+    values.append(''.join(value))
+    return values
+
+
+def encode_values(values, version=None, **fields):
+    """Encodes a list of values in the version 1 format (unless version 2 is asked for)."""
+    if version == VERSION:
+        return json.dumps(dict(v=VERSION, **fields), separators=(',', ':'))
+    return SEPARATOR.join(escape(str(value)) for value in values)
+
+
+def is_versioned(payload):
+    return payload.startswith('{')
+
+
+class Intent(namedtuple('Intent', ['name', 'params'])):
+    """An intent that was detected on the user's speech, with its parameters (all strings)."""
+    __slots__ = ()
+
+    @classmethod
+    def decode(cls, data):
+        payload = text(data)
+        if is_versioned(payload):
+            fields = json.loads(payload)
+            return cls(fields['intent'], [str(param) for param in fields.get('params', [])])
+        values = split_values(payload)
+        return cls(values[0], values[1:])
+
+    def encode(self, version=None):
+        return encode_values([self.name] + list(self.params), version=version, intent=self.name,
+                             params=list(self.params))
+
+
+def encode_hints(hints, version=None):
+    """Encodes the words that Dialogflow should especially recognise (see set_audio_hints).
+    In version 1, the separator (and escape) characters are replaced by spaces rather than escaped."""
+    if version == VERSION:
+        return encode_values(hints, version=version, hints=list(hints))
+    return SEPARATOR.join(plain(str(hint)) for hint in hints)
+
+
+def decode_hints(data):
+    payload = text(data)
+    if is_versioned(payload):
+        return [str(hint) for hint in json.loads(payload)['hints']]
+    return split_values(payload) if payload else []
@@ -0,0 +1,133 @@
+import copy
+import json
+import os
+from threading import Event, Thread
+from loguru import logger
+
+from emotion_wrapper import EMOTIONS, add_emotion
+
+# The sections of the configuration file that hold what the robot says
+SECTIONS = ('questions', 'responses', 'motivational_quotes')
+DEFAULT_LANGUAGE = 'en-US'
+
+
+class ContentSnapshot(object):
+    """An immutable index of what the robot says, per language key (e.g. 'en-US'), built from the configuration:
+     - the top level 'questions', 'responses' and 'motivational_quotes' are the content of its 'language';
+     - 'content' maps other language keys to any of these sections, with the texts that differ
+       (anything not given is taken from the default language).
+    All texts are prebuilt with every emotion (see emotion_wrapper.add_emotion), so that a lookup is a single
+    dictionary access. Motivational quotes are prebuilt with the 'quote_intro' response in front of them."""
+
+    def __init__(self, config, version=0):
+        self.settings = config
+        self.version = version
+        self.language = config.get('language', DEFAULT_LANGUAGE)
+        default = {section: config[section] for section in SECTIONS}
+        localised = {self.language: default}
+        for language, content in config.get('content', {}).items():
+            localised[language] = {
+                'questions': dict(default['questions'], **content.get('questions', {})),
+                'responses': dict(default['responses'], **content.get('responses', {})),
+                'motivational_quotes': content.get('motivational_quotes', default['motivational_quotes']),
+            }
+        self.languages = tuple(localised)
+        # language -> emotion -> key -> text
+        self.__questions = {}
+        self.__responses = {}
+        self.__quotes = {}
+        for language, content in localised.items():
+            emotions = (None,) + EMOTIONS
+            intro = content['responses'].get('quote_intro', '')
+            self.__questions[language] = {emotion: {key: self.__tagged(text, emotion)
+                                                    for key, text in content['questions'].items()}
+                                          for emotion in emotions}
+            self.__responses[language] = {emotion: {key: self.__tagged(text, emotion)
+                                                    for key, text in content['responses'].items()}
+                                          for emotion in emotions}
+            self.__quotes[language] = {emotion: tuple(self.__tagged(intro + quote, emotion)
+                                                      for quote in content['motivational_quotes'])
+                                       for emotion in emotions}
+
+    @staticmethod
+    def __tagged(text, emotion):
+        return text if emotion is None else add_emotion(text, emotion)
+
+    def with_language(self, language):
+        """The same content, with the given language (one of languages) instead of the configured one as default."""
+        if language not in self.languages:
+            raise KeyError(f'No content for {language} (only for {", ".join(self.languages)})')
+        snapshot = copy.copy(self)
+        snapshot.language = language
+        return snapshot
+
+    def question(self, key, emotion=None, language=None):
+        return self.__questions[language or self.language][emotion][key]
+
+    def response(self, key, emotion=None, language=None):
+        return self.__responses[language or self.language][emotion][key]
+
+    def quotes(self, emotion=None, language=None):
+        return self.__quotes[language or self.language][emotion]
+
+
+def load_content(path, version=0):
+    with open(path, 'r') as f:
+        config = json.load(f)
+    missing = [section for section in SECTIONS if not config.get(section)]
+    if missing:
+        raise ValueError(f'{path} has no {", ".join(missing)}')
+    return ContentSnapshot(config, version)
+
+
+class ContentIndex(object):
+    """Keeps the ContentSnapshot of a configuration file up to date while the application runs.
+    A watcher thread checks the file's modification time (a single stat call) every poll_interval seconds,
+    and builds a new snapshot when it changed. The new snapshot replaces the current one in a single assignment,
+    so readers never wait or see a partly built one; a conversation that holds on to a snapshot stays consistent.
+    A file that cannot be loaded (e.g. while it is being edited) is logged and the current snapshot is kept."""
+
+    # Seconds between the checks for a changed file
+    poll_interval = 1.0
+
+    def __init__(self, path='config/config.json'):
+        self.path = path
+        self.__stamp = self.__stat()
+        self.snapshot = load_content(path)
+        self.__stopped = Event()
+        self.__watcher = None
+
+    def __stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        # Also changes when an editor replaces the file instead of writing it
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def watch(self):
+        if self.__watcher is None:
+            self.__watcher = Thread(target=self.__watch, daemon=True)
+            self.__watcher.start()
+
+    def __watch(self):
+        while not self.__stopped.wait(self.poll_interval):
+            self.reload()
+
+    def reload(self, force=False):
+        """Builds a new snapshot if the file changed (or when forced); returns whether it did."""
+        stamp = self.__stat()
+        if stamp is None or (stamp == self.__stamp and not force):
+            return False
+        self.__stamp = stamp
+        try:
+            snapshot = load_content(self.path, self.snapshot.version + 1)
+        except Exception as e:
+            logger.error(f'Reloading {self.path} failed, keeping version {self.snapshot.version}: {e}')
+            return False
+        self.snapshot = snapshot
+        logger.info('Reloaded {} (version {}, languages {})', self.path, snapshot.version, snapshot.languages)
+        return True
+
+    def stop(self):
+        self.__stopped.set()
@@ -0,0 +1,227 @@
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+from emotion_wrapper import split_sentences
+
+
+class State(object):
+    def __init__(self, text, emotion=None, eye=None, prefetch=None, next=None):
+        """The text is a string or a function of the Conversation that returns one, and next is the name of the
+        next state, or a function of the Conversation that returns it (None ends the conversation).
+        Prefetch is a function of the Conversation that prepares what this state needs (see DialogueEngine);
+        its result is available as conversation.result(<name of this state>)."""
+        self.text = text
+        self.emotion = emotion
+        self.eye = eye
+        self.prefetch = prefetch
+        self.next = next
+
+
+class Say(State):
+    """The robot says something. Long texts (streamed) are said sentence by sentence, and are interrupted
+    after the current sentence by StudyBuddyApp.cancel_speech; the sentences that were not said are kept as
+    conversation.unspoken, so that they can be said later (a streamed text can also be a list of sentences)."""
+
+    def __init__(self, text, emotion=None, animated=True, streamed=False, gesture=None, eye=None, prefetch=None,
+                 next=None):
+        super().__init__(text, emotion=emotion, eye=eye, prefetch=prefetch, next=next)
+        self.animated = animated
+        self.streamed = streamed
+        self.gesture = gesture
+
+
+class Ask(State):
+    """The robot asks a question and listens in the given audio context (with the given audio hints) until an
+    intent was understood, asking to repeat it otherwise (up to the number of attempts)."""
+
+    def __init__(self, text, context, emotion=None, hints=None, record=False, timeout=5, attempts=3, eye=None,
+                 prefetch=None, next=None):
+        super().__init__(text, emotion=emotion, eye=eye, prefetch=prefetch, next=next)
+        self.context = context
+        self.hints = hints
+        self.record = record
+        self.timeout = timeout
+        self.attempts = attempts
+
+
+class NotUnderstood(Exception):
+    pass
+
+
+class Conversation(object):
+    """What a flow keeps track of during one conversation: any values (as attributes), the (pending) results of
+    the prefetches of its states, and the sentences of the last streamed text that were not said (if interrupted)."""
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+        self.prefetched = {}
+        self.unspoken = []
+
+    def result(self, state):
+        return self.prefetched[state].result()
+
+
+class DialogueEngine(object):
+    """Runs a conversation with a StudyBuddyApp as a graph of Say and Ask states (by name), from the start state.
+
+    Nothing waits for the robot to finish speaking unless it has to: the text of the next state is sent as soon as
+    the robot started the previous one (so that it follows without a pause), eye colours and gestures go out with
+    the text, and only listening waits until all speech is done. What comes next is prepared while the robot is
+    speaking: the audio context and hints of a question are set as soon as its state is entered, and the prefetch
+    of the next state runs in the background as soon as that state is certain (right away after a Say state
+    with a fixed next state, after the answer of an Ask state), e.g. to compute a schedule or pick a quote.
+    turns keeps, per audio context, the time from starting to say a question until its answer was understood."""
+
+    def __init__(self, app, states, start):
+        self.app = app
+        self.states = states
+        self.start = start
+        self.turns = defaultdict(list)
+        # The name of the state that the conversation is in (None between conversations)
+        self.state = None
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__unstarted = 0  # texts sent to the robot that it did not start to say yet
+        self.__unfinished = 0  # texts sent to the robot that it did not finish yet
+        self.__eyes = 0
+        self.__gestures = 0
+
+    def run(self, conversation):
+        app = self.app
+        # TextStarted events of texts that were said without the engine are not waited for by anyone
+        while app.text_started_lock.acquire(blocking=False):
+            pass
+        name = self.start
+        self.__prefetch(name, conversation)
+        try:
+            while name is not None and app.running:
+                state = self.states[name]
+                self.state = name
+                logger.debug('Dialogue state {}', name)
+                if isinstance(state, Ask):
+                    self.__ask(state, conversation)
+                else:
+                    # Saying something does not change what comes next, so a fixed next state is prepared right away
+                    if not callable(state.next):
+                        self.__prefetch(state.next, conversation)
+                    self.__say(state, conversation)
+                name = state.next(conversation) if callable(state.next) else state.next
+                self.__prefetch(name, conversation)
+        finally:
+            self.state = None
+            self.__finish()
+
+    def __prefetch(self, name, conversation):
+        state = self.states.get(name)
+        if state is not None and state.prefetch is not None and name not in conversation.prefetched:
+            conversation.prefetched[name] = self.__executor.submit(state.prefetch, conversation)
+
+    @staticmethod
+    def __text(text, conversation):
+        return text(conversation) if callable(text) else text
+
+    def __eye(self, colour):
+        if colour is not None:
+            self.app.set_eye_color(colour)
+            self.__eyes += 1
+
+    def __wait(self, lock, event, count):
+        """Waits for count robot events that release the lock (see StudyBuddyApp.wait_for); once one of them does not
+        come in time, the others are not waited for either (e.g. when the robot lost its connection)."""
+        for _ in range(count):
+            if not self.app.wait_for(lock, event):
+                return
+
+    def __started(self):
+        """Waits until the robot started saying all texts that were sent to it."""
+        self.__wait(self.app.text_started_lock, 'TextStarted', self.__unstarted)
+        self.__unstarted = 0
+
+    def __spoken(self):
+        """Waits until the robot finished saying all texts that were sent to it."""
+        self.__started()
+        self.__wait(self.app.text_lock, 'TextDone', self.__unfinished)
+        self.__unfinished = 0
+
+    def __speak(self, sentences, emotion=None, animated=True, cancellable=False, with_first=None):
+        """Sends each sentence once the robot started saying the one before it (queueing it right behind that one),
+        the first one together with the actions of with_first (a function). Returns the sentences that were not
+        sent because the speech was cancelled."""
+        say = self.app.say_animated if animated else self.app.say
+        for i, sentence in enumerate(sentences):
+            self.__started()
+            if cancellable and i > 0 and self.app.speech_cancelled.is_set():
+                logger.info(f'Speech interrupted, {len(sentences) - i} sentences left')
+                return sentences[i:]
+            with self.app.batch():
+                if i == 0 and with_first is not None:
+                    with_first()
+                say(sentence, emotion=emotion)
+            self.__unstarted += 1
+            self.__unfinished += 1
+        return []
+
+    def __say(self, state, conversation):
+        text = self.__text(state.text, conversation)
+        if state.streamed:
+            self.app.speech_cancelled.clear()
+            sentences = split_sentences(text) if isinstance(text, str) else list(text)
+        else:
+            sentences = [text]
+
+        def with_first():
+            self.__eye(state.eye)
+            if state.gesture is not None:
+                self.app.do_gesture(state.gesture)
+                self.__gestures += 1
+        unspoken = self.__speak(sentences, emotion=state.emotion, animated=state.animated,
+                                cancellable=state.streamed, with_first=with_first)
+        if state.streamed:
+            conversation.unspoken = unspoken
+
+    def __ask(self, state, conversation):
+        app = self.app
+
+        def prepare():
+            # While the robot is still speaking, so that it can start listening right after the question
+            self.__eye(state.eye)
+            app.set_audio_context(state.context)
+            if state.hints:
+                app.set_audio_hints(state.hints)
+            if state.record:
+                app.set_record_audio(True)
+        self.__speak([self.__text(state.text, conversation)], emotion=state.emotion, with_first=prepare)
+        self.__started()
+        start = time.perf_counter()
+        app.intent_understood = False
+        attempts = state.attempts
+        while True:
+            logger.info(f'Attempts {attempts}| audioContext {state.context}')
+            self.__spoken()
+            with app.batch():
+                self.__eye('white')
+                app.start_listening()
+            app.intent_lock.acquire(timeout=state.timeout)
+            app.stop_listening()
+            attempts -= 1
+            if app.intent_understood or attempts == 0:
+                break
+            self.__speak([app.texts.response('please_repeat')], with_first=lambda: self.__eye('red'))
+        if state.record:
+            app.set_record_audio(False)
+        if not app.intent_understood:
+            self.__speak([app.texts.response('repeat_timeout')])
+            raise NotUnderstood(state.context)
+        self.turns[state.context].append(time.perf_counter() - start)
+
+    def __finish(self):
+        """Waits until all speech, eye colour changes and gestures are done."""
+        self.__spoken()
+        self.__wait(self.app.eye_lock, 'EyeColourDone', self.__eyes)
+        self.__eyes = 0
+        self.__wait(self.app.gesture_lock, 'GestureDone', self.__gestures)
+        self.__gestures = 0
+
+    def stop(self):
+        self.__executor.shutdown(wait=False)
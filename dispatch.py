@@ -0,0 +1,105 @@
+from collections import deque
+from queue import SimpleQueue
+from threading import Condition, Thread, current_thread
+from loguru import logger
+
+# What a lane does with a new message when it is full:
+BLOCK = 'block'  # the listener waits (at most block_timeout seconds) until there is room, then drops the message
+DROP_OLDEST = 'drop_oldest'  # the oldest queued message is dropped, e.g. for perception that is sent continuously
+DROP_NEWEST = 'drop_newest'  # the new message is dropped
+
+
+class Lane(object):
+    """A bounded queue of messages that are handled one after the other (so in order) by the dispatcher's workers."""
+
+    # Maximum time (in seconds) that putting a message in a full lane with the block policy waits
+    block_timeout = 1.0
+
+    def __init__(self, name, handler, ready, maxsize=100, policy=BLOCK):
+        self.name = name
+        self.handler = handler
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.__ready = ready
+        self.__messages = deque()
+        self.__scheduled = False
+        self.__cond = Condition()
+
+    def __len__(self):
+        return len(self.__messages)
+
+    def put(self, topic, data):
+        with self.__cond:
+            if len(self.__messages) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    self.__messages.popleft()
+                    self.dropped += 1
+                elif self.policy == DROP_NEWEST or not self.__cond.wait_for(
+                        lambda: len(self.__messages) < self.maxsize, timeout=self.block_timeout):
+                    self.dropped += 1
+                    logger.warning('Lane {} is full: dropped a message on {}', self.name, topic)
+                    return
+            self.__messages.append((topic, data))
+            schedule = not self.__scheduled
+            self.__scheduled = True
+        if schedule:
+            self.__ready.put(self)
+
+    def run(self):
+        """Handles the oldest message (in a worker thread), and schedules the lane again if there are more."""
+        with self.__cond:
+            topic, data = self.__messages.popleft()
+            self.__cond.notify()
+        try:
+            self.handler(topic, data)
+        except Exception as e:
+            # A failing handler should neither stop the worker nor the other messages from being handled
+            logger.exception(f'Handling {topic} failed: {e}')
+        with self.__cond:
+            self.__scheduled = len(self.__messages) > 0
+            more = self.__scheduled
+        if more:
+            self.__ready.put(self)
+
+
+class Dispatcher(object):
+    """Hands messages off from a listener thread to a small pool of worker threads, so that slow (or failing)
+    event handlers never hold up the delivery of other messages. Messages are put in lanes: within a lane they are
+    handled in order, while different lanes are handled in parallel. Fast lanes (e.g. for the robot's completion
+    events) have a worker thread of their own, which the other lanes can never keep busy.
+    Usage:
+        dispatcher = Dispatcher(workers=2)
+        lane = dispatcher.lane('speech', handler, maxsize=100, policy=BLOCK)
+        lane.put('audio_intent', 'answer_yes')  # calls handler('audio_intent', 'answer_yes') in a worker
+        ...
+        dispatcher.stop()"""
+
+    def __init__(self, workers=2):
+        self.__ready = SimpleQueue()
+        self.__fast_ready = SimpleQueue()
+        self.__threads = [Thread(target=self.__work, args=(self.__ready,), daemon=True) for _ in range(workers)]
+        self.__threads.append(Thread(target=self.__work, args=(self.__fast_ready,), daemon=True))
+        for thread in self.__threads:
+            thread.start()
+
+    def lane(self, name, handler, maxsize=100, policy=BLOCK, fast=False):
+        """Creates a lane whose messages are passed to the given handler(topic, data)."""
+        return Lane(name, handler, self.__fast_ready if fast else self.__ready, maxsize=maxsize, policy=policy)
+
+    @staticmethod
+    def __work(ready):
+        while True:
+            lane = ready.get()
+            if lane is None:
+                break
+            lane.run()
+
+    def stop(self, timeout=1.0):
+        """Stops the workers after the lanes that are waiting for one; messages that are queued later are dropped."""
+        for _ in self.__threads[:-1]:
+            self.__ready.put(None)
+        self.__fast_ready.put(None)
+        for thread in self.__threads:
+            if thread is not current_thread():
+                thread.join(timeout=timeout)
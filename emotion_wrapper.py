@@ -1,4 +1,25 @@
-import nltk.data
+import re
+
+_tokenizer = None
+# The emotions that add_emotion can express
+EMOTIONS = ('happy', 'empathetic')
+
+
+def split_sentences(text):
+    '''
+    Splitting the robot's speech into sentences, so that it can be spoken (and interrupted) sentence by sentence
+    :param text: string of robot's speech
+    :return: list of sentences, using nltk's punkt tokenizer if it is available (see SETUP_MODE in study_buddy)
+    '''
+    global _tokenizer
+    if _tokenizer is None:
+        try:
+            import nltk.data
+            _tokenizer = nltk.data.load('tokenizers/punkt/english.pickle').tokenize
+        except (ImportError, LookupError):
+            # Without punkt, split after sentence-ending punctuation that is followed by whitespace
+            _tokenizer = re.compile(r'(?<=[.!?])\s+').split
+    return [sentence for sentence in _tokenizer(text.strip()) if sentence]
 
 
 def add_emotion(str, emotion):
@@ -8,9 +29,6 @@ def add_emotion(str, emotion):
     :param emotion: string of emotions to express, can be 'happy', 'empathetic', tbc
     :return: new emotional string
     '''
-    # tokenizer = nltk.data.load('tokenizers/punkt/english.pickle')
-    # sentences = tokenizer.tokenize(str)
-
     # '\pau=500\ pause in milliseconds
     #  \vol=90\ volume 0-100
     #  \vct=90\  voice pitch 50-200
@@ -0,0 +1,246 @@
+import json
+import math
+import re
+import zipfile
+from collections import defaultdict, namedtuple
+from pathlib import Path
+from loguru import logger
+
+IntentMatch = namedtuple('IntentMatch', ['intent', 'params', 'confidence'])
+
+NUMBER_WORDS = {
+    'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9,
+    'ten': 10, 'eleven': 11, 'twelve': 12, 'thirteen': 13, 'fourteen': 14, 'fifteen': 15, 'sixteen': 16,
+    'seventeen': 17, 'eighteen': 18, 'nineteen': 19, 'twenty': 20, 'thirty': 30, 'forty': 40, 'fifty': 50,
+    'sixty': 60, 'seventy': 70, 'eighty': 80, 'ninety': 90, 'hundred': 100,
+}
+NUMBER_TOKEN = '<number>'
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def parse_number(token):
+    if token.isdigit():
+        return int(token)
+    return NUMBER_WORDS.get(token)
+
+
+def ngrams(tokens, n=2):
+    """Returns the unigrams and bigrams (by default) of the given tokens."""
+    grams = list(tokens)
+    for size in range(2, n + 1):
+        grams += [' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+    return grams
+
+
+class Slot(object):
+    def __init__(self, name, entity):
+        self.name = name
+        self.entity = entity
+
+    def accepts(self, tokens):
+        if self.entity == '@sys.number-integer':
+            return len(tokens) == 1 and parse_number(tokens[0]) is not None
+        if self.entity == '@sys.given-name':
+            return len(tokens) == 1
+        return len(tokens) > 0
+
+    def value(self, tokens):
+        if self.entity == '@sys.number-integer':
+            return str(parse_number(tokens[0]))
+        return ' '.join(tokens)
+
+
+class Intent(object):
+    def __init__(self, name, contexts, params, templates):
+        """Name is the action name (which is what the robot sends on audio_intent), params is the list of
+        (name, entity) parameter definitions and templates are the training phrases as lists of tokens and Slots."""
+        self.name = name
+        self.contexts = contexts
+        self.params = params
+        self.templates = templates
+
+    def match_template(self, tokens, free=True):
+        """Returns the slot values of the most specific training phrase (i.e. the one with the most words besides
+        its slots) that the tokens fit exactly, and its number of words; or None if there is no such phrase.
+        Phrases that consist of slots only (which fit nearly anything) are skipped unless free is set."""
+        best = None
+        for template in self.templates:
+            words = sum(1 for item in template if not isinstance(item, Slot))
+            if (words == 0 and not free) or (best is not None and words <= best[1]):
+                continue
+            values = self.__fit(template, 0, tokens, 0, {})
+            if values is not None:
+                best = (values, words)
+        return best
+
+    def __fit(self, template, i, tokens, j, values):
+        if i == len(template):
+            return values if j == len(tokens) else None
+        item = template[i]
+        if not isinstance(item, Slot):
+            if j < len(tokens) and tokens[j] == item:
+                return self.__fit(template, i + 1, tokens, j + 1, values)
+            return None
+        # Slots are matched lazily: as few tokens as possible while still fitting the rest of the phrase
+        for end in range(j + 1, len(tokens) + 1):
+            if item.accepts(tokens[j:end]):
+                found = dict(values)
+                found.setdefault(item.name, item.value(tokens[j:end]))
+                result = self.__fit(template, i + 1, tokens, end, found)
+                if result is not None:
+                    return result
+        return None
+
+    def extract(self, tokens, text):
+        """Best-effort parameter values for an utterance that does not fit any of the training phrases exactly."""
+        values = {}
+        for name, entity in self.params:
+            if entity == '@sys.number-integer':
+                numbers = [parse_number(t) for t in tokens if parse_number(t) is not None]
+                if numbers:
+                    values[name] = str(numbers[0])
+            elif entity == '@sys.any':
+                values[name] = text.strip()
+        return values
+
+    def ordered(self, values):
+        return [values[name] for name, _ in self.params if name in values]
+
+
+class IntentMatcher(object):
+    """Local stand-in for Dialogflow's intent detection, built from the agent export (dialogflow.zip).
+    It indexes the training phrases (with custom entity slots expanded by their entries) as TF-IDF weighted
+    word uni- and bigrams, and matches recognised text against the intents that are active in the given context:
+     - if the text fits a training phrase exactly (with typed slots such as numbers validated),
+       the confidence is 1 and the parameters are taken from the slots;
+     - otherwise the confidence is the cosine similarity with the closest training phrase,
+       and the parameters are extracted on a best-effort basis."""
+
+    def __init__(self, intents, entities=None):
+        self.intents = {intent.name: intent for intent in intents}
+        self.__documents = []  # intent name of every indexed phrase
+        self.__postings = defaultdict(list)  # ngram -> [(document, weight)]
+        self.__idf = {}
+        self.__index(entities or {})
+
+    @classmethod
+    def from_export(cls, path='dialogflow.zip', language='en'):
+        """Loads an agent export, either the zip file itself or the directory it was extracted to."""
+        path = Path(path)
+        if path.is_dir():
+            files = {str(p.relative_to(path)): p.read_bytes() for p in path.rglob('*.json')}
+        else:
+            with zipfile.ZipFile(path) as archive:
+                files = {name: archive.read(name) for name in archive.namelist() if name.endswith('.json')}
+        entities = {}
+        for name, content in files.items():
+            if name.startswith('entities/') and name.endswith(f'_entries_{language}.json'):
+                entity = name[len('entities/'):-len(f'_entries_{language}.json')]
+                entities['@' + entity] = [s for entry in json.loads(content) for s in entry['synonyms']]
+        intents = []
+        for name, content in files.items():
+            if not name.startswith('intents/') or name.endswith(f'_usersays_{language}.json'):
+                continue
+            definition = json.loads(content)
+            if definition.get('fallbackIntent'):
+                continue
+            response = definition['responses'][0]
+            params = [(p['name'], p['dataType']) for p in response.get('parameters', [])]
+            usersays = files.get(name[:-len('.json')] + f'_usersays_{language}.json')
+            templates = [cls.__template(phrase['data']) for phrase in json.loads(usersays)] if usersays else []
+            intents.append(Intent(response.get('action') or definition['name'],
+                                  definition.get('contexts', []), params, templates))
+        logger.debug(f'Loaded {len(intents)} intents and {len(entities)} entities from {path}')
+        return cls(intents, entities)
+
+    @staticmethod
+    def __template(data):
+        template = []
+        for part in data:
+            if part.get('alias') and part.get('meta') != '@sys.ignore':
+                template.append(Slot(part['alias'], part['meta']))
+            else:
+                template += tokenize(part['text'])
+        return template
+
+    def __index(self, entities):
+        phrases = []
+        for intent in self.intents.values():
+            for template in intent.templates:
+                # Slots of custom entities are expanded with all of their entries; numbers become a single token
+                variants = [[]]
+                for item in template:
+                    if not isinstance(item, Slot):
+                        variants = [v + [item] for v in variants]
+                    elif item.entity == '@sys.number-integer':
+                        variants = [v + [NUMBER_TOKEN] for v in variants]
+                    elif item.entity in entities:
+                        variants = [v + tokenize(entry) for v in variants for entry in entities[item.entity]]
+                for tokens in variants:
+                    if tokens:
+                        phrases.append((intent.name, ngrams(tokens)))
+        document_frequency = defaultdict(int)
+        for _, grams in phrases:
+            for gram in set(grams):
+                document_frequency[gram] += 1
+        self.__idf = {gram: math.log((1 + len(phrases)) / (1 + df)) + 1 for gram, df in document_frequency.items()}
+        for name, grams in phrases:
+            weights = self.__weigh(grams)
+            document = len(self.__documents)
+            self.__documents.append(name)
+            for gram, weight in weights.items():
+                self.__postings[gram].append((document, weight))
+
+    def __weigh(self, grams):
+        counts = defaultdict(int)
+        for gram in grams:
+            if gram in self.__idf:
+                counts[gram] += 1
+        weights = {gram: count * self.__idf[gram] for gram, count in counts.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        return {gram: w / norm for gram, w in weights.items()} if norm > 0 else {}
+
+    def candidates(self, context=None):
+        """The intents that Dialogflow would consider in the given context (all of them without a context)."""
+        return [i for i in self.intents.values() if context is None or not i.contexts or context in i.contexts]
+
+    def match(self, text, context=None):
+        """Returns the best IntentMatch for the text within the given context, or None if nothing matches at all."""
+        tokens = tokenize(text)
+        if not tokens:
+            return None
+        candidates = self.candidates(context)
+        best = None
+        for intent in candidates:
+            # Phrases without any fixed words are only trusted when the context already restricts the intent
+            found = intent.match_template(tokens, free=context is not None and bool(intent.contexts))
+            if found is not None and (best is None or found[1] > best[2]):
+                best = (intent, found[0], found[1])
+        if best is not None:
+            return IntentMatch(best[0].name, best[0].ordered(best[1]), 1.0)
+
+        allowed = {intent.name for intent in candidates}
+        query = [NUMBER_TOKEN if parse_number(t) is not None else t for t in tokens]
+        scores = defaultdict(float)
+        for gram, weight in self.__weigh(ngrams(query)).items():
+            for document, doc_weight in self.__postings.get(gram, ()):
+                if self.__documents[document] in allowed:
+                    scores[document] += weight * doc_weight
+        if not scores:
+            return None
+        best = max(scores, key=scores.get)
+        intent = self.intents[self.__documents[best]]
+        return IntentMatch(intent.name, intent.ordered(intent.extract(tokens, text)), scores[best])
+
+
+if __name__ == '__main__':
+    # Try out the matcher offline: python intent_matcher.py [context], then type utterances
+    import sys
+    matcher = IntentMatcher.from_export()
+    active_context = sys.argv[1] if len(sys.argv) > 1 else None
+    for line in sys.stdin:
+        print(matcher.match(line, context=active_context))
@@ -0,0 +1,162 @@
+import json
+import os
+from bisect import bisect_left
+from collections import defaultdict, deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Event, Lock, Thread
+from time import perf_counter
+from loguru import logger
+
+# Actions (channel, and data if it matters) and the robot events that signal their start and completion
+ACTION_EVENTS = {
+    'action_say': ('TextStarted', 'TextDone'),
+    'action_say_animated': ('TextStarted', 'TextDone'),
+    'action_gesture': ('GestureStarted', 'GestureDone'),
+    'action_eyecolour': ('EyeColourStarted', 'EyeColourDone'),
+    'action_play_audio': ('PlayAudioStarted', 'PlayAudioDone'),
+    'audio_language': (None, 'LanguageChanged'),
+    ('action_idle', 'true'): (None, 'SetIdle'),
+    ('action_idle', 'false'): (None, 'SetNonIdle'),
+}
+
+
+class LatencyHistogram(object):
+    """Counts latencies in (roughly logarithmic) buckets, from 1 ms up to a minute."""
+    bounds = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 60.0]
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, pct):
+        """Estimates the percentile by interpolating linearly within its bucket."""
+        rank = pct / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                low = self.bounds[i - 1] if i > 0 else 0.0
+                high = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(self.max, low + (high - low) * (rank - seen) / count)
+            seen += count
+        return 0.0
+
+    def summary(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99),
+                'max': self.max}
+
+
+class ActionMetrics(object):
+    """Correlates the actions that are sent with the robot events that confirm them, and keeps latency histograms:
+     - per action, from sending it until its *Started event ('action_say started') and its *Done event ('action_say');
+     - per intent (and for recognised text), from the last start of listening until it came in
+       ('intent students_feeling', 'speech text'); and if that was after listening had already stopped,
+       also from that stop ('late intent students_feeling').
+    Recording a measurement only takes a timestamp and a few dictionary operations."""
+
+    # Actions that have not been confirmed after this many seconds are assumed to have lost their event
+    max_age = 120.0
+
+    def __init__(self):
+        self.histograms = defaultdict(LatencyHistogram)
+        self.__pending = defaultdict(deque)  # event -> [(label, time sent)]
+        self.__listening_since = None
+        self.__stopped_listening_at = None
+        self.__lock = Lock()
+
+    def sent(self, channel, data):
+        now = perf_counter()
+        events = ACTION_EVENTS.get(channel) or ACTION_EVENTS.get((channel, data))
+        with self.__lock:
+            if events is not None:
+                started, done = events
+                if started is not None:
+                    self.__pending[started].append((f'{channel} started', now))
+                self.__pending[done].append((channel, now))
+            elif channel == 'action_audio':
+                if data == 'start listening':
+                    self.__listening_since = now
+                    self.__stopped_listening_at = None
+                else:
+                    self.__stopped_listening_at = now
+
+    def event(self, event):
+        now = perf_counter()
+        with self.__lock:
+            pending = self.__pending.get(event)
+            while pending:
+                label, sent = pending.popleft()
+                if now - sent <= self.max_age:
+                    self.histograms[label].observe(now - sent)
+                    break
+
+    def heard(self, label):
+        """Records something that was recognised from the user's speech, e.g. 'intent time_left' or 'speech text'."""
+        now = perf_counter()
+        with self.__lock:
+            if self.__listening_since is not None:
+                self.histograms[label].observe(now - self.__listening_since)
+            if self.__stopped_listening_at is not None:
+                self.histograms[f'late {label}'].observe(now - self.__stopped_listening_at)
+
+    def observe(self, label, seconds):
+        """Records a latency that was measured elsewhere, e.g. 'redis resubscribe' (see transport.Transport)."""
+        with self.__lock:
+            self.histograms[label].observe(seconds)
+
+    def snapshot(self):
+        """Returns the summary (count, mean, p50, p90, p99 and max in seconds) of every histogram."""
+        with self.__lock:
+            return {label: histogram.summary() for label, histogram in sorted(self.histograms.items())}
+
+    def dump(self, path):
+        """Appends the current snapshot to the given file as a JSON line."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps({'time': datetime.now().isoformat(timespec='seconds'),
+                                'latencies': self.snapshot()}) + '\n')
+
+    def dump_periodically(self, path, interval=60.0):
+        """Dumps a snapshot every interval seconds (in a daemon thread) until the returned Event is set."""
+        stopped = Event()
+
+        def run():
+            while not stopped.wait(interval):
+                self.dump(path)
+        Thread(target=run, daemon=True).start()
+        return stopped
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serves the current snapshot as JSON over HTTP (in a daemon thread). Returns the server."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(metrics.snapshot()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+        server = HTTPServer((host, port), Handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f'Serving latency metrics on http://{host}:{port}/')
+        return server
+
+    def log_summary(self):
+        for label, s in self.snapshot().items():
+            logger.info(f"Latency {label}: n={s['count']} p50={1000 * s['p50']:.0f}ms "
+                        f"p90={1000 * s['p90']:.0f}ms max={1000 * s['max']:.0f}ms")
@@ -0,0 +1,102 @@
+# How the messages on a (continuously sent) perception topic are passed on:
+LAST_VALUE = 'last_value'  # at most one per interval: the first right away, then the latest one when it has passed
+DEBOUNCE = 'debounce'  # only the latest one, once no new message came in for the interval
+ON_CHANGE = 'on_change'  # only transitions: '<topic>_arrived' for a new value, and '<topic>_left' for a value
+# that was not sent again within the interval (the hold timeout)
+
+
+class LastValue(object):
+    def __init__(self, topic, interval):
+        self.topic = topic
+        self.interval = interval
+        self.__delivered = None
+        self.__pending = None
+
+    def offer(self, data, now):
+        if self.__delivered is None or now - self.__delivered >= self.interval:
+            self.__delivered = now
+            self.__pending = None
+            return [(self.topic, data)]
+        self.__pending = data
+        return []
+
+    def tick(self, now):
+        if self.__pending is None or now - self.__delivered < self.interval:
+            return []
+        data, self.__pending = self.__pending, None
+        self.__delivered = now
+        return [(self.topic, data)]
+
+
+class Debounce(object):
+    def __init__(self, topic, interval):
+        self.topic = topic
+        self.interval = interval
+        self.__received = None
+        self.__pending = None
+
+    def offer(self, data, now):
+        self.__received = now
+        self.__pending = data
+        return []
+
+    def tick(self, now):
+        if self.__pending is None or now - self.__received < self.interval:
+            return []
+        data, self.__pending = self.__pending, None
+        return [(self.topic, data)]
+
+
+class OnChange(object):
+    def __init__(self, topic, interval):
+        self.topic = topic
+        self.interval = interval
+        self.__seen = {}  # value -> time it was last received
+
+    def offer(self, data, now):
+        arrived = data not in self.__seen
+        self.__seen[data] = now
+        return [(f'{self.topic}_arrived', data)] if arrived else []
+
+    def tick(self, now):
+        left = [data for data, seen in self.__seen.items() if now - seen >= self.interval]
+        for data in left:
+            del self.__seen[data]
+        return [(f'{self.topic}_left', data) for data in left]
+
+
+POLICIES = {LAST_VALUE: LastValue, DEBOUNCE: Debounce, ON_CHANGE: OnChange}
+# Turns the continuously sent person and face detections into arrived/left transitions (with a 1.5s hold timeout)
+PRESENCE = {'detected_person': (ON_CHANGE, 1.5), 'recognised_face': (ON_CHANGE, 1.5)}
+
+
+class PerceptionFilter(object):
+    """Coalesces the messages on high-frequency perception topics according to a (policy, interval) per topic;
+    messages on other topics are passed on as they are. Both offer() and tick() return the messages
+    (topic, data) that should be handled; tick() has to be called regularly (e.g. whenever the listener wakes up),
+    as the delayed messages and 'left' transitions are only produced by it. Not thread-safe."""
+
+    def __init__(self, policies):
+        self.__filters = {}
+        for topic, (policy, interval) in policies.items():
+            if policy not in POLICIES:
+                raise ValueError(f'Unknown perception policy {policy} for {topic}')
+            self.__filters[topic] = POLICIES[policy](topic, interval)
+        self.topics = frozenset(self.__filters)
+        # Number of messages that were not passed on right away
+        self.coalesced = 0
+
+    def offer(self, topic, data, now):
+        f = self.__filters.get(topic)
+        if f is None:
+            return [(topic, data)]
+        messages = f.offer(data, now)
+        if not messages:
+            self.coalesced += 1
+        return messages
+
+    def tick(self, now):
+        messages = []
+        for f in self.__filters.values():
+            messages += f.tick(now)
+        return messages
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+Profile = namedtuple('Profile', ['face_id', 'visits', 'last_seen', 'feelings', 'plan'])
+# A schedule that was made for the student: its parameters (see scheduler.Schedule) and when it was made
+Plan = namedtuple('Plan', ['created', 'time_est', 'time_remaining', 'start_hour', 'fudge_ratio'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (face_id TEXT PRIMARY KEY, visits INTEGER NOT NULL, last_seen REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS feelings (face_id TEXT NOT NULL, time REAL NOT NULL, feeling TEXT, score REAL);
+CREATE INDEX IF NOT EXISTS feelings_by_student ON feelings (face_id, time);
+CREATE TABLE IF NOT EXISTS plans (face_id TEXT NOT NULL, created REAL NOT NULL, time_est REAL NOT NULL,
+                                  time_remaining REAL NOT NULL, start_hour REAL NOT NULL, fudge_ratio REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS plans_by_student ON plans (face_id, created);
+"""
+
+
+class ProfileStore(object):
+    """Keeps the profiles of students, keyed by the identifier of their recognised face, in an SQLite database:
+    their number of visits, their recent feelings (with the anxiety score they got) and their latest study plan.
+    Profiles that were looked up are kept in an LRU cache, so that (after prefetching it when the face is first
+    recognised) a lookup during the conversation costs microseconds. All changes are written through right away."""
+
+    # Number of past feelings that a profile includes
+    recent_feelings = 5
+
+    def __init__(self, path='profiles.db', cache_size=256):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.cache_size = cache_size
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        self.__db.executescript(SCHEMA)
+        # Without waiting for the disk on every commit; a crash loses at most the last changes
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('PRAGMA synchronous=NORMAL')
+        self.__cache = OrderedDict()
+        self.__lock = Lock()
+
+    def get(self, face_id):
+        """Returns the Profile of the student with the given face, or None if the face was never seen before."""
+        with self.__lock:
+            if face_id in self.__cache:
+                self.__cache.move_to_end(face_id)
+                return self.__cache[face_id]
+            profile = self.__load(face_id)
+            self.__cache[face_id] = profile
+            if len(self.__cache) > self.cache_size:
+                self.__cache.popitem(last=False)
+            return profile
+
+    def __load(self, face_id):
+        row = self.__db.execute('SELECT visits, last_seen FROM students WHERE face_id = ?', (face_id,)).fetchone()
+        if row is None:
+            return None
+        feelings = self.__db.execute('SELECT time, feeling, score FROM feelings WHERE face_id = ? '
+                                     'ORDER BY time DESC LIMIT ?', (face_id, self.recent_feelings)).fetchall()
+        plan = self.__db.execute('SELECT created, time_est, time_remaining, start_hour, fudge_ratio FROM plans '
+                                 'WHERE face_id = ? ORDER BY created DESC LIMIT 1', (face_id,)).fetchone()
+        return Profile(face_id, row[0], row[1], feelings, Plan(*plan) if plan is not None else None)
+
+    def record_visit(self, face_id, feeling=None, score=None):
+        """Counts a visit of the student, and stores how they felt (and the resulting anxiety score) if given."""
+        now = time.time()
+        with self.__lock:
+            with self.__db:
+                self.__db.execute('INSERT INTO students VALUES (?, 1, ?) ON CONFLICT (face_id) '
+                                  'DO UPDATE SET visits = visits + 1, last_seen = excluded.last_seen', (face_id, now))
+                if feeling is not None:
+                    self.__db.execute('INSERT INTO feelings VALUES (?, ?, ?, ?)', (face_id, now, feeling, score))
+            self.__cache.pop(face_id, None)
+
+    def record_plan(self, face_id, schedule):
+        """Stores the parameters of a scheduler.Schedule that was made for the student."""
+        with self.__lock:
+            with self.__db:
+                self.__db.execute('INSERT INTO plans VALUES (?, ?, ?, ?, ?, ?)',
+                                  (face_id, time.time(), schedule.time_needed / schedule.fudge_ratio,
+                                   len(schedule.types) / 2, schedule.start_hour, schedule.fudge_ratio))
+            self.__cache.pop(face_id, None)
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+
+def active_plan(profile, now=None):
+    """Returns the plan of the profile if its deadline has not passed yet, and the hours since it was made."""
+    if profile is None or profile.plan is None:
+        return None, 0.0
+    elapsed = ((now if now is not None else time.time()) - profile.plan.created) / 3600
+    if elapsed >= profile.plan.time_remaining:
+        return None, elapsed
+    return profile.plan, elapsed
@@ -0,0 +1,225 @@
+import heapq
+import itertools
+import re
+import time
+from threading import Condition, Thread
+from loguru import logger
+from codec import Intent
+from intent_matcher import IntentMatcher
+from transport import CONNECTION_ERRORS, Transport
+
+
+class RobotSimulator(object):
+    """Stands in for the robot and Dialogflow, so that an application can run without a Nao or network access.
+    It listens to the action channels on Redis and answers them with the events a robot would send
+    (TextStarted/TextDone, GestureDone, EyeColourDone, LanguageChanged, ...) after realistic delays.
+    Whenever listening starts, the next scripted answer for the current audio context is 'heard':
+    its text is sent on text_speech, followed by the intent that Dialogflow would detect for it on audio_intent
+    (determined by the IntentMatcher). Contexts without (remaining) answers stay silent.
+    Anything else the user says is fed with hear(): its words are recognised only while the speech stream is open
+    (from shortly after listening starts until it stops), and are sent as interim results as they are said.
+    While audio is being recorded, stopping to listen in a context with a recording (a WAV file) sends its path
+    on audio_newfile. While the robot is looking, the given face is detected and recognised continuously.
+    Usage:
+        sim = RobotSimulator({'activation': ['Hello study buddy'], 'students_feeling': ['I am feeling great']})
+        ...
+        sim.stop()"""
+
+    # Delays (in seconds) of the simulated robot and Dialogflow, all divided by the speed factor
+    delays = {
+        'started': 0.05,  # from an action to its *Started event
+        'per_char': 0.06,  # speaking time per character of text (without tags), of the robot and the user
+        'gesture': 2.0,
+        'eye_colour': 0.3,
+        'language': 0.5,
+        'idle': 0.5,
+        'audio': 1.0,
+        'answer': 1.5,  # from starting to listen to the recognised text
+        'stream': 0.3,  # from starting to listen until the speech stream is open (and what is said is heard)
+        'intent': 0.4,  # from the recognised text to the detected intent
+        'recording': 0.2,  # from stopping to listen to the stored recording
+        'frame': 0.2,  # between the detections of the camera
+    }
+
+    def __init__(self, answers=None, namespace=None, speed=1.0, delays=None, matcher=None, recordings=None,
+                 face=None, **connection_kwargs):
+        """Answers map audio contexts to the list of texts that the user says (in order) in that context,
+        and recordings map them to the WAV file of such an answer.
+        A speed factor above 1 makes everything happen proportionally faster.
+        The connection arguments are passed on to the transport.Transport (e.g. unix_socket_path)."""
+        self.answers = {context: list(texts) for context, texts in (answers or {}).items()}
+        self.recordings = dict(recordings or {})
+        self.recording = False
+        self.face = face
+        self.looking = False
+        self.namespace = namespace
+        self.speed = speed
+        self.delays = dict(self.delays, **(delays or {}))
+        self.matcher = matcher if matcher is not None else IntentMatcher.from_export()
+        self.audio_context = None
+        self.listening = False
+        self.stream_open = None  # from when the current speech stream is open (None when not listening)
+        self.session = 0  # counts the speech streams, so that a word is only heard within a single one
+        self.speaking_until = 0.0
+        self.received = []  # (time, channel, data) of all actions
+        self.sent = []  # (time, channel, data) of all events and recognition results
+        self.transport = Transport(**connection_kwargs)
+        self.__subscription = self.transport.subscribe(
+            channels=[self.__channel(c) for c in ('audio_language', 'audio_context', 'audio_hints')],
+            patterns=[self.__channel('action_*'), self.__channel('dialogflow_*')])
+        self.__queue = []
+        self.__order = itertools.count()
+        self.__queue_cond = Condition()
+        self.__running = True
+        self.__threads = [Thread(target=self.__listen), Thread(target=self.__publish), Thread(target=self.__look)]
+        for t in self.__threads:
+            t.start()
+
+    def __channel(self, name):
+        return name if self.namespace is None else f'{self.namespace}:{name}'
+
+    def __delay(self, name, factor=1.0):
+        return self.delays[name] * factor / self.speed
+
+    def __later(self, delay, channel, data):
+        with self.__queue_cond:
+            entry = (time.monotonic() + delay, next(self.__order), self.__channel(channel), data)
+            heapq.heappush(self.__queue, entry)
+            self.__queue_cond.notify()
+
+    def __event(self, started, done, duration, after=0.0):
+        if started is not None:
+            self.__later(after + self.__delay('started'), 'events_robot', started)
+        self.__later(after + self.__delay('started') + duration, 'events_robot', done)
+
+    def __publish(self):
+        while self.__running:
+            with self.__queue_cond:
+                if not self.__queue:
+                    self.__queue_cond.wait(timeout=0.1)
+                    continue
+                wait = self.__queue[0][0] - time.monotonic()
+                if wait > 0:
+                    self.__queue_cond.wait(timeout=wait)
+                    continue
+                _, _, channel, data = heapq.heappop(self.__queue)
+            self.sent.append((time.monotonic(), channel[len(self.__channel('')):], data))
+            self.__publish_now(channel, data)
+
+    def __publish_now(self, channel, data):
+        try:
+            self.transport.publish(channel, data)
+        except CONNECTION_ERRORS as e:
+            logger.error(f'Simulator failed to publish on {channel}: {e}')
+
+    def __look(self):
+        while self.__running:
+            if self.looking and self.face is not None:
+                self.__publish_now(self.__channel('detected_person'), '')
+                self.__publish_now(self.__channel('recognised_face'), self.face)
+            time.sleep(self.__delay('frame'))
+
+    def __listen(self):
+        prefix = len(self.__channel(''))
+        while self.__running:
+            message = self.__subscription.get_message(timeout=0.1)
+            if message is None:
+                continue
+            channel = message['channel'].decode()[prefix:]
+            data = message['data'].decode()
+            self.received.append((time.monotonic(), channel, data))
+            try:
+                self.__handle(channel, data)
+            except Exception as e:
+                logger.exception(f'Simulator failed to handle {channel}: {e}')
+        self.__subscription.close()
+
+    def __handle(self, channel, data):
+        if channel in ('action_say', 'action_say_animated'):
+            # Texts are spoken one after the other, like the robot does
+            spoken = re.sub(r'\\[^\\]*\\', '', data)
+            now = time.monotonic()
+            after = max(0.0, self.speaking_until - now)
+            duration = self.__delay('per_char', len(spoken))
+            self.speaking_until = now + after + self.__delay('started') + duration
+            self.__event('TextStarted', 'TextDone', duration, after=after)
+        elif channel == 'action_gesture':
+            self.__event('GestureStarted', 'GestureDone', self.__delay('gesture'))
+        elif channel == 'action_eyecolour':
+            self.__event('EyeColourStarted', 'EyeColourDone', self.__delay('eye_colour'))
+        elif channel == 'action_play_audio':
+            self.__event('PlayAudioStarted', 'PlayAudioDone', self.__delay('audio'))
+        elif channel == 'action_idle':
+            self.__event(None, 'SetIdle' if data == 'true' else 'SetNonIdle', self.__delay('idle'))
+        elif channel == 'audio_language':
+            self.__event(None, 'LanguageChanged', self.__delay('language'))
+        elif channel == 'audio_context':
+            self.audio_context = data
+        elif channel == 'action_audio' and data == 'start listening':
+            self.listening = True
+            self.session += 1
+            self.stream_open = time.monotonic() + self.__delay('stream')
+            self.__answer()
+        elif channel == 'action_audio' and data == 'stop listening':
+            self.listening = False
+            self.stream_open = None
+            if self.recording and self.audio_context in self.recordings:
+                self.__later(self.__delay('recording'), 'audio_newfile', self.recordings[self.audio_context])
+        elif channel == 'action_video':
+            self.looking = data == 'start watching'
+        elif channel == 'dialogflow_record':
+            self.recording = data == '1'
+
+    def __answer(self):
+        texts = self.answers.get(self.audio_context)
+        if not texts:
+            return
+        text = texts.pop(0)
+        self.__later(self.__delay('answer'), 'text_speech', text)
+        match = self.matcher.match(text, context=self.audio_context)
+        if match is not None:
+            self.__later(self.__delay('answer') + self.__delay('intent'), 'audio_intent',
+                         Intent(match.intent, match.params).encode())
+
+    def hear(self, text, interim=True):
+        """The user says the text, starting now; returns (right away) when they will have finished.
+        Each word is heard if the speech stream was open while it was said. The words heard within one stream are
+        sent on text_speech (after every word as interim results, and all of them once the stream has heard the
+        last one), followed by the intent that Dialogflow would detect in them."""
+        words = text.split()
+        start = time.monotonic()
+        ends = list(itertools.accumulate(self.__delay('per_char', len(word) + 1) for word in words))
+        Thread(target=self.__utter, args=(words, start, ends, interim), daemon=True).start()
+        return start + ends[-1] if ends else start
+
+    def __utter(self, words, start, ends, interim):
+        heard, session, context = [], None, None
+        begin = start
+        for word, end in zip(words, ends):
+            time.sleep(max(0.0, start + end - time.monotonic()))
+            opened, current = self.stream_open, self.session
+            if session is not None and current != session:
+                self.__recognised(heard, context)
+                heard, session = [], None
+            if opened is not None and opened <= begin:
+                heard.append(word)
+                session, context = current, self.audio_context
+                if interim and len(heard) < len(words):
+                    self.__publish_now(self.__channel('text_speech'), ' '.join(heard))
+            begin = start + end
+        self.__recognised(heard, context)
+
+    def __recognised(self, words, context):
+        if not words:
+            return
+        text = ' '.join(words)
+        self.__publish_now(self.__channel('text_speech'), text)
+        match = self.matcher.match(text, context=context)
+        if match is not None:
+            self.__later(self.__delay('intent'), 'audio_intent', Intent(match.intent, match.params).encode())
+
+    def stop(self):
+        self.__running = False
+        for t in self.__threads:
+            t.join()
+        self.transport.close()
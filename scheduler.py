@@ -1,49 +1,118 @@
 from datetime import datetime
 import math
+import numpy as np
 from loguru import logger
 
+ACTIVITIES = ['revise', 'take a break', 'have a snack', 'get some exercise', 'get some sleep', 'relax']
+REVISE, BREAK, SNACK, EXERCISE, SLEEP, RELAX = range(len(ACTIVITIES))
+
+
 def make_schedule(time_est: int, time_remaining: int, start_hour=None, fudge_ratio=2.0):
-    """Generates a pomodoro-like schedule with given parameters."""
-
-    if time_est is None or time_remaining is None:
-        logger.warning(f'Invalid times: time_est: {time_est}\ttime_remaining: {time_remaining}')
-        time_est = 2
-        time_remaining = 3
-
-    # Get the current hour if no start time is provided
-    if start_hour is None:
-        start_hour = float(datetime.now().hour)
-        start_hour += math.ceil(2*(datetime.now().minute / 60))/2
-    # We compensate for planning fallacy with a fudge ratio
-    # time_needed = time_est * fudge_ratio
-    # Next, we use a Pomodoro scheme to create work/break bins
-    bins = int(2 * time_remaining)
-    bin_assignments = []
-    time_stamp = float(start_hour)
-    last_activity = None
-    for i in range(bins):
-        btype = 'revise'
-        if i % 3 == 0:
-            btype = 'take a break'
-        if i % 6 == 0 and time_stamp < 22:
-            btype = 'have a snack'
-        if i % 12 == 0:
-            btype = 'get some exercise'
-        if i == 0:
-            btype = 'revise'
-        if time_stamp < 7.0:
-            btype = 'get some sleep'
-        if btype != last_activity:
-            bin_start = stringify_time(time_stamp)
-            # bin_end = stringify_time(time_stamp + 0.5)
-            bin_assignments.append(f'At {bin_start}, {btype}')
-        last_activity = btype
-        time_stamp += 0.5
-        if time_stamp > 24.0:
-            time_stamp -= 24.0
-    if len(bin_assignments) > 8:
-        return bin_assignments[:8]
-    return bin_assignments
+    """Generates a pomodoro-like schedule with given parameters (its first page, see Schedule)."""
+    return Schedule(time_est, time_remaining, start_hour=start_hour, fudge_ratio=fudge_ratio).page(0)
+
+
+def bin_types(start_hour: float, bins: int, offset=0, work_bins=None, sleep_window=(0.0, 7.0), snacks_until=22.0):
+    """Assigns an activity to each of the half-hour bins offset .. offset + bins after the start hour (at once).
+    Every 3rd bin is a break, every 6th a snack (unless it is late), every 12th exercise; the first is revision.
+    Bins in the sleep window (from, until; which may wrap around midnight) are for sleeping,
+    and once work_bins bins of revision have been scheduled, the student can relax for the rest of the day(s).
+    Returns the hours of the day and the activity (index in ACTIVITIES) of the bins."""
+    index = np.arange(offset, offset + bins)
+    hours = (start_hour + 0.5 * index) % 24.0
+    types = np.full(bins, REVISE, dtype=np.int8)
+    types[index % 3 == 0] = BREAK
+    types[(index % 6 == 0) & (hours < snacks_until)] = SNACK
+    types[index % 12 == 0] = EXERCISE
+    types[index == 0] = REVISE
+    asleep_from, asleep_until = sleep_window
+    if asleep_from <= asleep_until:
+        asleep = (hours >= asleep_from) & (hours < asleep_until)
+    else:
+        asleep = (hours >= asleep_from) | (hours < asleep_until)
+    types[asleep] = SLEEP
+    if work_bins is not None:
+        # A bin comes after the work is done if the revision bins before it (not including itself) suffice
+        revised = np.cumsum(types == REVISE)
+        done = np.concatenate(([work_bins <= 0], revised[:-1] >= work_bins))
+        types[done & ~asleep] = RELAX
+    return hours, types
+
+
+class Schedule(object):
+    """A study schedule of half-hour bins from now (or the given start hour) until the deadline.
+    The estimated work (in hours) is multiplied by a fudge ratio to compensate for the planning fallacy,
+    and the resulting revision time is spread over the bins that are not for sleeping or breaks.
+    The schedule is read out in pages of entries such as 'At 14 30, take a break' (one per change of activity),
+    and can be replanned when the student reports progress."""
+
+    def __init__(self, time_est, time_remaining, start_hour=None, fudge_ratio=2.0, sleep_window=(0.0, 7.0),
+                 page_size=8):
+        try:
+            time_est, time_remaining = float(time_est), float(time_remaining)
+        except (TypeError, ValueError):
+            logger.warning(f'Invalid times: time_est: {time_est}\ttime_remaining: {time_remaining}')
+            time_est = 2
+            time_remaining = 3
+        # A deadline that has passed leaves no time to plan
+        time_remaining = max(0.0, time_remaining)
+
+        # Get the current hour if no start time is provided
+        if start_hour is None:
+            start_hour = float(datetime.now().hour)
+            start_hour += math.ceil(2*(datetime.now().minute / 60))/2
+        self.start_hour = float(start_hour)
+        self.fudge_ratio = fudge_ratio
+        self.sleep_window = sleep_window
+        self.page_size = page_size
+        # We compensate for planning fallacy with a fudge ratio
+        self.time_est = time_est
+        self.time_needed = time_est * fudge_ratio
+        # Next, we use a Pomodoro scheme to create work/break bins
+        self.hours, self.types = bin_types(self.start_hour, int(2 * time_remaining),
+                                           work_bins=math.ceil(2 * self.time_needed), sleep_window=sleep_window)
+        self.__entries = None
+        revision = np.count_nonzero(self.types == REVISE) / 2
+        if revision < self.time_needed:
+            logger.warning(f'Only {revision}h of revision fits before the deadline, {self.time_needed}h is needed')
+
+    def entries(self):
+        """Returns the (bin index, activity index) of every change of activity."""
+        if self.__entries is None:
+            changes = np.flatnonzero(self.types[1:] != self.types[:-1]) + 1
+            starts = np.concatenate(([0], changes)) if len(self.types) else changes
+            self.__entries = list(zip(starts.tolist(), self.types[starts].tolist()))
+        return self.__entries
+
+    def __len__(self):
+        return len(self.entries())
+
+    @property
+    def pages(self):
+        return math.ceil(len(self) / self.page_size)
+
+    def page(self, number, hours_elapsed=0.0):
+        """Returns the given page (starting at 0) of the schedule as readable sentences.
+        When resuming the schedule the given number of hours after its start, it starts at the current activity."""
+        entries = self.entries()
+        offset = int(2 * hours_elapsed)
+        if offset > 0:
+            current = [(offset, int(self.types[offset]))] if offset < len(self.types) else []
+            entries = current + [entry for entry in entries if entry[0] > offset]
+        entries = entries[number * self.page_size:(number + 1) * self.page_size]
+        return [f'At {stringify_time(self.hours[i])}, {ACTIVITIES[t]}' for i, t in entries]
+
+    def replan(self, hours_done, hours_elapsed):
+        """Updates the rest of the schedule after the student did the given hours of revision in the given time.
+        Only the bins after the elapsed time are recomputed, keeping the rhythm of breaks of the original plan.
+        The hours done are real hours, so they count against the estimate, and the rest of it is fudged again."""
+        offset = min(len(self.types), int(math.ceil(2 * hours_elapsed)))
+        remaining = max(0.0, self.time_est - hours_done) * self.fudge_ratio
+        _, types = bin_types(self.start_hour, len(self.types) - offset, offset=offset,
+                             work_bins=math.ceil(2 * remaining), sleep_window=self.sleep_window)
+        self.types = np.concatenate((self.types[:offset], types))
+        self.__entries = None
+        return self
 
 
 def stringify_time(hour: float):
@@ -0,0 +1,73 @@
+from collections import OrderedDict, namedtuple
+from threading import Lock, Thread
+from loguru import logger
+
+Sentiment = namedtuple('Sentiment', ['polarity', 'subjectivity'])
+
+
+class SentimentEngine(object):
+    """Scores the sentiment of utterances with TextBlob's default (pattern) analyser, which gives exactly the same
+    scores as TextBlob(text).sentiment, but:
+     - imports TextBlob (and thereby nltk) only when it is first needed, and
+       loads the lexicon up front (optionally in the background) instead of on the first call mid-conversation;
+     - memoizes the scores in a bounded LRU cache keyed by the normalized utterance;
+     - offers score_many() to score a batch of utterances (e.g. for offline transcript analysis)."""
+
+    def __init__(self, anxiety_threshold=0.4, cache_size=1024):
+        """Utterances with a polarity below the anxiety threshold are classified as anxious."""
+        self.anxiety_threshold = anxiety_threshold
+        self.cache_size = cache_size
+        self.__cache = OrderedDict()
+        self.__cache_lock = Lock()
+        self.__warm_lock = Lock()
+        self.__textblob = None
+
+    def warm_up(self, background=False):
+        """Loads the sentiment lexicon (which TextBlob otherwise does lazily on its first use).
+        With background=True this happens in a daemon thread, and the (returned) thread can be joined if needed."""
+        if background:
+            t = Thread(target=self.warm_up, daemon=True)
+            t.start()
+            return t
+        with self.__warm_lock:
+            if self.__textblob is None:
+                logger.debug('Loading sentiment lexicon')
+                from textblob import TextBlob
+                TextBlob('warm up').sentiment
+                self.__textblob = TextBlob
+                logger.debug('Sentiment lexicon loaded')
+
+    @staticmethod
+    def normalize(text):
+        """The analyser splits on whitespace, so collapsing it does not change the score."""
+        return ' '.join(text.split())
+
+    def score(self, text):
+        """Returns the Sentiment (polarity, subjectivity) of the given utterance."""
+        key = self.normalize(text)
+        with self.__cache_lock:
+            cached = self.__cache.get(key)
+            if cached is not None:
+                self.__cache.move_to_end(key)
+                return cached
+        if self.__textblob is None:
+            self.warm_up()
+        sent = self.__textblob(key).sentiment
+        result = Sentiment(sent.polarity, sent.subjectivity)
+        with self.__cache_lock:
+            self.__cache[key] = result
+            if len(self.__cache) > self.cache_size:
+                self.__cache.popitem(last=False)
+        return result
+
+    def score_many(self, texts):
+        """Returns the Sentiment of each of the given utterances (in the same order), scoring duplicates only once."""
+        scores = {}
+        for text in texts:
+            key = self.normalize(text)
+            if key not in scores:
+                scores[key] = self.score(key)
+        return [scores[self.normalize(text)] for text in texts]
+
+    def is_anxious(self, text):
+        return self.score(text).polarity < self.anxiety_threshold
@@ -0,0 +1,95 @@
+import time
+from threading import Lock, Thread
+from loguru import logger
+from AbstractApplication import AbstractApplication
+from dispatch import Dispatcher
+from transport import Transport
+
+
+class SessionHub(object):
+    """Hosts many applications (e.g. one StudyBuddyApp per robot) in a single process.
+    All of them share one Transport (with its bounded connection pool) for their actions and one pattern
+    subscription (on '*:<topic>') with a single listener thread, which routes each message to the application
+    registered under its namespace.
+    Their event functions are run by a shared Dispatcher with the given number of workers.
+    Usage:
+        hub = SessionHub(max_connections=8)
+        apps = [StudyBuddyApp(namespace=f'robot{i}', hub=hub) for i in range(24)]
+        ...
+        hub.stop()"""
+
+    # Maximum time (in seconds) the listener blocks on the socket before checking if it should stop
+    listen_timeout = 0.1
+
+    def __init__(self, max_connections=8, dispatch_workers=4, **connection_kwargs):
+        """The connection arguments are passed on to the transport.Transport (e.g. host and port, or
+        unix_socket_path)."""
+        self.transport = Transport(max_connections=max_connections, **connection_kwargs)
+        self.dispatcher = Dispatcher(dispatch_workers)
+        self.__sessions = {}
+        self.__routes = {}  # raw namespace -> application
+        self.__topics = {topic.encode(): topic for topic in AbstractApplication.topics}
+        self.__sessions_lock = Lock()
+        self.__subscription = self.transport.subscribe(patterns=[f'*:{topic}' for topic in AbstractApplication.topics])
+        self.__running = True
+        self.__listener = Thread(target=self.__listen)
+        self.__listener.start()
+
+    def register(self, app):
+        """Routes all messages in the namespace of the given application to it (done by the application itself)."""
+        with self.__sessions_lock:
+            if app.namespace in self.__sessions:
+                raise ValueError(f'Namespace {app.namespace} is already in use')
+            self.__sessions[app.namespace] = app
+            self.__routes[app.namespace.encode()] = app
+
+    def unregister(self, app):
+        with self.__sessions_lock:
+            if self.__sessions.get(app.namespace) is app:
+                del self.__sessions[app.namespace]
+                del self.__routes[app.namespace.encode()]
+
+    def __len__(self):
+        return len(self.__sessions)
+
+    def __listen(self):
+        next_tick = time.monotonic()
+        while self.__running:
+            message = self.__subscription.get_message(timeout=self.listen_timeout)
+            if time.monotonic() >= next_tick:
+                next_tick = time.monotonic() + self.listen_timeout
+                self.__tick()
+            if message is None:
+                continue
+            # Routed on the raw channel; the data is only decoded by the event function of the application
+            namespace, _, topic = message['channel'].rpartition(b':')
+            app = self.__routes.get(namespace)
+            topic = self.__topics.get(topic)
+            if app is None or topic is None:
+                continue
+            try:
+                app._dispatch(topic, message['data'])
+            except Exception as e:
+                # One misbehaving session should not take down all the others
+                logger.exception(f'Session {namespace} failed to handle {topic}: {e}')
+        self.__subscription.close()
+
+    def __tick(self):
+        with self.__sessions_lock:
+            apps = list(self.__sessions.values())
+        for app in apps:
+            try:
+                app._tick()
+            except Exception as e:
+                logger.exception(f'Session {app.namespace} failed to tick: {e}')
+
+    def stop(self):
+        """Stops all hosted applications and then the shared listener."""
+        with self.__sessions_lock:
+            apps = list(self.__sessions.values())
+        for app in apps:
+            app.stop()
+        self.__running = False
+        self.__listener.join(timeout=3 * self.listen_timeout)
+        self.dispatcher.stop()
+        self.transport.close()
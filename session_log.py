@@ -0,0 +1,132 @@
+import atexit
+import glob
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from queue import SimpleQueue
+from threading import Thread
+from loguru import logger
+
+
+class ChannelSampler(object):
+    """Decides which messages on a channel get logged: all of them, except for the channels with a sample rate n,
+    of which only every n-th message is (e.g. detected_person, which is sent continuously)."""
+
+    def __init__(self, rates=None):
+        self.rates = dict(rates or {})
+        self.__counts = defaultdict(int)
+
+    def should_log(self, channel):
+        rate = self.rates.get(channel)
+        if rate is None:
+            return True
+        count = self.__counts[channel]
+        self.__counts[channel] = count + 1
+        return count % rate == 0
+
+
+class RotatingFile(object):
+    """Appends lines to '<prefix>_<time><suffix>' files in a directory, starting a new file once the current one
+    gets too big or too old, and deleting the oldest files once there are more than the given number of them."""
+
+    def __init__(self, directory, prefix, suffix, max_bytes=10 * 1024 * 1024, max_age=24 * 3600, keep=30):
+        self.directory = directory
+        self.prefix = prefix
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep = keep
+        self.__file = None
+        self.__opened = 0.0
+
+    def __rotate(self):
+        if self.__file is not None:
+            self.__file.close()
+        stamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S_%f')
+        self.__file = open(os.path.join(self.directory, f'{self.prefix}_{stamp}{self.suffix}'), 'a')
+        self.__opened = time.time()
+        old = sorted(glob.glob(os.path.join(self.directory, f'{self.prefix}_*{self.suffix}')))
+        for path in old[:max(0, len(old) - self.keep)]:
+            os.remove(path)
+
+    def write(self, line):
+        if (self.__file is None or self.__file.tell() > self.max_bytes
+                or time.time() - self.__opened > self.max_age):
+            self.__rotate()
+        self.__file.write(line)
+
+    def flush(self):
+        if self.__file is not None:
+            self.__file.flush()
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+
+def to_jsonl(message):
+    """Formats a log message as a compact JSON line (time, level, message, source and any bound extras)."""
+    record = message.record
+    entry = {'t': round(record['time'].timestamp(), 4), 'l': record['level'].name, 'm': record['message'],
+             'src': f"{record['name']}:{record['function']}:{record['line']}"}
+    if record['extra']:
+        entry['x'] = record['extra']
+    return json.dumps(entry, separators=(',', ':'), default=str) + '\n'
+
+
+class BackgroundSink(object):
+    """A loguru sink that only puts the (already formatted) messages in a queue: a single daemon thread
+    writes them to the outputs, each given as a (stream, format function) pair, so that logging does not block
+    the calling thread on I/O. Unlike loguru's enqueue option, nothing is pickled or sent through a pipe."""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.__queue = SimpleQueue()
+        self.__writer = Thread(target=self.__write, daemon=True)
+        self.__writer.start()
+        atexit.register(self.stop)
+
+    def __call__(self, message):
+        self.__queue.put(message)
+
+    def __write(self):
+        stopping = False
+        while not stopping:
+            # Write everything that is queued, then flush once
+            messages = [self.__queue.get()]
+            while not self.__queue.empty():
+                messages.append(self.__queue.get())
+            for message in messages:
+                if message is None:
+                    stopping = True
+                    continue
+                for stream, fmt in self.outputs:
+                    stream.write(fmt(message))
+            for stream, _ in self.outputs:
+                stream.flush()
+
+    def stop(self):
+        """Writes the remaining messages and stops the writer thread."""
+        if self.__writer.is_alive():
+            self.__queue.put(None)
+            self.__writer.join()
+
+
+def configure_logging(logdir='logs/', level='DEBUG', max_bytes=10 * 1024 * 1024, max_age=24 * 3600, keep=30):
+    """Logs to stderr, to a rotated text log and to a compact JSONL session log in the log directory.
+    Only the formatting happens in the logging thread; the writing is done by a BackgroundSink,
+    so that logging never delays the thread that dispatches the robot's events."""
+    if not os.path.exists(logdir):
+        os.makedirs(logdir)
+    sink = BackgroundSink([
+        (sys.stderr, str),
+        (RotatingFile(logdir, 'log', '.log', max_bytes=max_bytes, max_age=max_age, keep=keep), str),
+        (RotatingFile(logdir, 'session', '.jsonl', max_bytes=max_bytes, max_age=max_age, keep=keep), to_jsonl),
+    ])
+    logger.remove()
+    logger.add(sink, level=level)
+    return sink
@@ -0,0 +1,218 @@
+"""Records all pub/sub traffic of an application into a compact binary trace, and replays such traces.
+
+A trace file starts with a magic header, followed by one record per message: a fixed-size header
+(the seconds since the start of the trace as a double, the direction, and the lengths of the channel and data)
+and the UTF-8 encoded channel and data. Records are only ever appended, so a trace can be read while it is
+being written, and stays readable up to its last complete record when the application crashes.
+Channels are stored without namespace, and the data of actions that carry credentials (e.g. the Dialogflow key)
+is not stored at all: such a record only holds REDACTED.
+
+Usage:
+    python session_trace.py show logs/session.trace
+    python session_trace.py replay logs/session.trace [--speed 1 | --max-speed] [--record replayed.trace]"""
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from threading import Condition, Event, Lock, Thread
+from loguru import logger
+from transport import Transport
+
+INBOUND, OUTBOUND = 0, 1
+# What is recorded instead of the data of an action that carries credentials (see AbstractApplication.secret_channels)
+REDACTED = '<redacted>'
+MAGIC = b'SBTRACE1'
+RECORD = struct.Struct('<dBHI')
+
+TraceRecord = namedtuple('TraceRecord', ['time', 'direction', 'channel', 'data'])
+
+
+class TraceWriter(object):
+    """Writes the messages of an application to a (new) trace file. Safe to use from multiple threads.
+    Records are buffered, and flushed by a daemon thread every flush_interval seconds (if there are any),
+    so that they reach the file even when the application is idle."""
+
+    # Maximum number of seconds that records stay in the write buffer
+    flush_interval = 1.0
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.__file = open(path, 'wb')
+        self.__file.write(MAGIC)
+        self.__start = time.monotonic()
+        self.__dirty = True
+        self.__lock = Lock()
+        self.__closed = Event()
+        Thread(target=self.__flush_periodically, daemon=True).start()
+
+    def write(self, direction, channel, data):
+        now = time.monotonic()
+        channel = channel.encode()
+        data = data if isinstance(data, bytes) else str(data).encode()
+        with self.__lock:
+            if self.__file.closed:
+                return
+            self.__file.write(RECORD.pack(now - self.__start, direction, len(channel), len(data)) + channel + data)
+            self.__dirty = True
+
+    def __flush_periodically(self):
+        while not self.__closed.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self.__lock:
+            if self.__dirty and not self.__file.closed:
+                self.__file.flush()
+                self.__dirty = False
+
+    def close(self):
+        self.__closed.set()
+        with self.__lock:
+            self.__file.close()
+
+
+def read_trace(path):
+    """Yields the TraceRecords of a trace file one by one, without loading the whole file."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a session trace')
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            t, direction, channel_length, data_length = RECORD.unpack(header)
+            payload = f.read(channel_length + data_length)
+            if len(payload) < channel_length + data_length:
+                logger.warning('Trace {} ends with an incomplete record', path)
+                return
+            yield TraceRecord(t, direction, payload[:channel_length].decode(), payload[channel_length:].decode())
+
+
+class Replayer(object):
+    """Feeds the inbound messages of a trace back to an application (by publishing them on its namespace),
+    at the recorded pace divided by the speed factor (or as fast as possible with an infinite speed).
+    Pass the replayer as the application's trace, so that it sees which actions the application sends:
+    an inbound message is only published after the application has sent as many actions as it had when the
+    message was recorded (e.g. a TextDone only comes after the say), and the recorded delay between the two
+    is kept. Inbound messages on channels that the application itself publishes to (audio_language) are
+    echoes of its own actions, and are not replayed. The replayed actions can be recorded into a new trace."""
+
+    # Maximum number of seconds to wait for the application to send the actions an inbound message follows
+    wait_timeout = 5.0
+
+    def __init__(self, path, namespace, speed=1.0, record=None, **connection_kwargs):
+        self.path = path
+        self.namespace = namespace
+        self.speed = speed
+        self.sent = []  # (time, channel, data) of the actions of the replaying application
+        self.__recorder = TraceWriter(record) if record is not None else None
+        self.__sent_cond = Condition()
+        self.__transport = Transport(**connection_kwargs)
+        self.__echoes = {r.channel for r in read_trace(path) if r.direction == OUTBOUND}
+
+    def write(self, direction, channel, data):
+        if self.__recorder is not None:
+            self.__recorder.write(direction, channel, data)
+        if direction == OUTBOUND:
+            with self.__sent_cond:
+                self.sent.append((time.monotonic(), channel, str(data)))
+                self.__sent_cond.notify_all()
+
+    def close(self):
+        if self.__recorder is not None:
+            self.__recorder.close()
+        self.__transport.close()
+
+    def __wait_for_actions(self, count):
+        """Waits until the application sent the given number of actions; returns when it sent the last of them."""
+        with self.__sent_cond:
+            if not self.__sent_cond.wait_for(lambda: len(self.sent) >= count, timeout=self.wait_timeout):
+                logger.warning('Replay diverged: expected {} actions, only {} were sent', count, len(self.sent))
+                return None
+            return self.sent[count - 1][0] if count else None
+
+    def run(self):
+        """Replays the trace; returns the number of published messages."""
+        start = time.monotonic()
+        actions = 0
+        last_action = 0.0  # recorded time of the latest action
+        published = 0
+        for record in read_trace(self.path):
+            if record.direction == OUTBOUND:
+                actions += 1
+                last_action = record.time
+                continue
+            if record.channel in self.__echoes:
+                continue
+            sent_at = self.__wait_for_actions(actions)
+            anchor = sent_at if sent_at is not None else start
+            delay = anchor + (record.time - (last_action if actions else 0.0)) / self.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.__transport.publish(f'{self.namespace}:{record.channel}', record.data)
+            published += 1
+        return published
+
+    def divergence(self):
+        """Returns the index of the first replayed action that went to another channel than the recorded one,
+        or None if the application sent the recorded actions. Their data is not compared, as the application
+        may vary its phrasing."""
+        count = 0
+        for record in read_trace(self.path):
+            if record.direction != OUTBOUND:
+                continue
+            if count >= len(self.sent) or self.sent[count][1] != record.channel:
+                return count
+            count += 1
+        return count if count < len(self.sent) else None
+
+
+def show(path):
+    for record in read_trace(path):
+        arrow = '<-' if record.direction == INBOUND else '->'
+        print(f'{record.time:10.3f} {arrow} {record.channel}: {record.data[:100]}')
+
+
+def replay(path, speed, record=None, namespace='replay'):
+    """Replays a trace through a StudyBuddyApp, and reports the duration and whether it behaved the same."""
+    from study_buddy import StudyBuddyApp
+    replayer = Replayer(path, namespace, speed=speed, record=record)
+    with tempfile.NamedTemporaryFile('w', suffix='.json') as key:
+        key.write('{}')
+        key.flush()
+        app = StudyBuddyApp(namespace=namespace, key_file=key.name, trace=replayer, profiles_db=':memory:')
+    conversation = Thread(target=app.main, daemon=True)
+    start = time.monotonic()
+    conversation.start()
+    published = replayer.run()
+    duration = time.monotonic() - start
+    app.stop()
+    # A diverged conversation may be stuck waiting for an event that will never come
+    conversation.join(timeout=5.0)
+    recorded = max((r.time for r in read_trace(path)), default=0.0)
+    print(f'Replayed {published} messages of {recorded:.1f}s in {duration:.1f}s; '
+          f'{len(replayer.sent)} actions were sent')
+    diverged = replayer.divergence()
+    if diverged is not None:
+        print(f'Actions diverged from the recording at action #{diverged}')
+    return diverged
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['show', 'replay'])
+    parser.add_argument('trace')
+    parser.add_argument('--speed', type=float, default=1.0, help='factor by which the replay is faster')
+    parser.add_argument('--max-speed', action='store_true', help='replay without any of the recorded delays')
+    parser.add_argument('--record', help='also record the replay into this trace')
+    args = parser.parse_args()
+    if args.command == 'show':
+        show(args.trace)
+    else:
+        logger.remove()
+        logger.add(sys.stderr, level='INFO')
+        replay(args.trace, float('inf') if args.max_speed else args.speed, record=args.record)
@@ -0,0 +1,54 @@
+import json
+import os
+import platform
+from datetime import datetime
+from threading import Lock, Thread
+from time import perf_counter
+from loguru import logger
+
+
+class StartupProfile(object):
+    """Times the phases of starting up the application, so that the startup time can be compared across releases.
+    Phases are timed either as the time since the previous mark, or by running them in the background."""
+
+    def __init__(self, report_file=None):
+        """If a report file is given (e.g. logs/startup.jsonl), each report is also appended to it as a JSON line."""
+        self.report_file = report_file
+        self.start = perf_counter()
+        self.phases = []
+        self.__last = self.start
+        self.__lock = Lock()
+
+    def mark(self, name):
+        """Records the time since the previous mark (or since the creation of this profile) as the given phase."""
+        now = perf_counter()
+        with self.__lock:
+            self.phases.append({'phase': name, 'seconds': round(now - self.__last, 4), 'background': False})
+            self.__last = now
+
+    def background(self, name, target):
+        """Runs the target in a daemon thread and records how long it took (once it is done) as the given phase."""
+        def run():
+            start = perf_counter()
+            target()
+            with self.__lock:
+                self.phases.append({'phase': name, 'seconds': round(perf_counter() - start, 4), 'background': True})
+        t = Thread(target=run, daemon=True)
+        t.start()
+        return t
+
+    def report(self):
+        """Logs the time per phase and the total time until now (and appends it to the report file, if any)."""
+        total = perf_counter() - self.start
+        with self.__lock:
+            phases = list(self.phases)
+        summary = ', '.join(f"{p['phase']}{' (bg)' if p['background'] else ''} {1000 * p['seconds']:.0f}ms"
+                            for p in phases)
+        logger.info(f'Startup took {1000 * total:.0f}ms: {summary}')
+        if self.report_file is not None:
+            os.makedirs(os.path.dirname(self.report_file) or '.', exist_ok=True)
+            with open(self.report_file, 'a') as f:
+                f.write(json.dumps({'time': datetime.now().isoformat(timespec='seconds'),
+                                    'python': platform.python_version(),
+                                    'total': round(total, 4),
+                                    'phases': phases}) + '\n')
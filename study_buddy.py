@@ -1,22 +1,35 @@
+from startup_profile import StartupProfile
+# Created before the other imports, so that the time spent importing is part of the startup report
+STARTUP = StartupProfile(report_file='logs/startup.jsonl')
+
 import AbstractApplication as Base
-from threading import Semaphore
+from threading import Condition, Event, Semaphore
 from loguru import logger
 import random
-from textblob import TextBlob
-import nltk
+import json
 from datetime import datetime
-import sys
 import os
-import json
-from scheduler import make_schedule
-from time import sleep
-
-from emotion_wrapper import add_emotion
+from content import ContentIndex
+from dialogue import Ask, Conversation, DialogueEngine, NotUnderstood, Say
+from audio_features import AudioFeaturePipeline, arousal
+from intent_matcher import IntentMatcher
+from perception import PRESENCE
+from profiles import ProfileStore, active_plan
+from scheduler import Schedule
+from sentiment import SentimentEngine
+from session_log import configure_logging
+from wake_phrase import WakePhraseDetector
+import time
+
+from emotion_wrapper import split_sentences
+
+STARTUP.mark('imports')
 
 SETUP_MODE = False
 LOGDIR = 'logs/'
 
 if SETUP_MODE:
+    import nltk
     logger.warning(f'Setup: Downloading nltk corpa...')
     try:
         nltk.download('punkt')
@@ -27,13 +40,35 @@ if SETUP_MODE:
 
 
 class StudyBuddyApp(Base.AbstractApplication):
+    # Minimal confidence of the local intent matcher to act on its result instead of waiting for Dialogflow's
+    local_intent_confidence = 0.75
+    # Maximum time (in seconds) to wait for the recording of an answer and its prosody,
+    # before judging the answer on its text alone
+    audio_feature_timeout = 1.0
+    # In standby, the robot keeps listening in a single session, which is only restarted when nothing was heard
+    # for this long (in seconds), so that a stream that was dropped or timed out is recovered
+    standby_timeout = 30.0
+    # The student is followed by their face arriving and leaving, rather than by every detection
+    perception_policies = PRESENCE
+    # Words that Dialogflow should especially recognise in standby (see set_audio_hints)
+    wake_hints = ['study', 'buddy', 'robot', 'Nao', 'hello', 'hi']
+    # Maximum time (in seconds) to wait for the robot to confirm an action (e.g. with TextDone), after which its
+    # event is assumed to be lost and the application carries on
+    event_timeout = 30.0
+
     # setup our Application
-    def __init__(self):
-        super().__init__()
+    def __init__(self, namespace=None, hub=None, startup=None, key_file='production_diagFl_key.json', trace=None,
+                 transport=None, profiles_db=None):
+        """The profiles of the students are kept in the profiles_db of the configuration, unless another database
+        is given (e.g. ':memory:' for replays and benchmarks, which should not touch the real profiles)."""
+        self.startup = startup if startup is not None else StartupProfile()
+        super().__init__(namespace=namespace, hub=hub, trace=trace, transport=transport)
+        self.startup.mark('connect')
 
         # Semaphores for async execution. They make sure that the action is completed.
         self.language_lock = Semaphore(0)
         self.text_lock = Semaphore(0)
+        self.text_started_lock = Semaphore(0)
         self.intent_lock = Semaphore(0)
         self.gesture_lock = Semaphore(0)
         self.eye_lock = Semaphore(0)
@@ -44,120 +79,310 @@ class StudyBuddyApp(Base.AbstractApplication):
         self.activation = False
         self.student_feeling = []
         self.yes_answer = True
+        self.speech_cancelled = Event()
         # self.changing_wish = None
-        # self.schedule = None
+        self.schedule = None
         self.hours_remaining = None
         self.hours_needed = None
+        # The hours of revision a returning student did since their schedule was made
+        self.hours_done = None
+        self.audio_context = None
+        self.answered_locally = False
+        self.intent_matcher = None
+        self.last_heard = None
 
         # Pass the required Dialogflow parameters (add your Dialogflow parameters)
-        self.set_dialogflow_key('production_diagFl_key.json')
+        self.set_dialogflow_key(key_file)
         self.set_dialogflow_agent('sir-study-buddy-258913')
+        self.startup.mark('dialogflow')
 
-        # Import data from config file
+        # Import data from config file; what the robot says is reloaded whenever the file changes
         try:
-            with open('config/config.json', 'r') as cfile:
-                self.config_data = json.load(cfile)
-                self.questions = self.config_data['questions']
-                self.responses = self.config_data['responses']
-                logger.debug('Loaded JSON config')
+            self.content = ContentIndex('config/config.json')
+            self.config_data = self.content.snapshot.settings
+            logger.debug('Loaded JSON config')
         except Exception as e:
             logger.error(f'JSON loading failed with: {e}')
             raise e
+        # The content of the current conversation, which only changes between conversations
+        self.texts = self.content.snapshot
+        # The language of the next conversation (the configured one, unless the student asked for another one),
+        # the configured language that it was chosen from, and the language that the robot was last set to
+        self.language = self.configured_language = self.texts.language
+        self.robot_language = None
+        self.content.watch()
+        self.startup.mark('config')
+        self.wake_phrases = WakePhraseDetector(self.config_data.get('wake_phrases', []))
+
+        # Import nltk and textblob and load their data in the background (while the language is being set),
+        # so that neither the startup nor the first answer is delayed by it
+        self.sentiment = SentimentEngine(
+            anxiety_threshold=self.config_data.get('anxiety_threshold', 0.4))
+        self.startup.background('nlp warm-up', self.warm_up_nlp)
+        # The prosody of recorded answers is computed in worker processes (see on_new_audio_file), and is weighed
+        # into the anxiety decision by how much its arousal differs from neutral (0.5)
+        self.audio_features = AudioFeaturePipeline()
+        self.answer_audio = {}
+        self.answer_audio_cond = Condition()
+        self.record_answers = self.config_data.get('record_answers', False)
+        self.prosody_weight = self.config_data.get('prosody_weight', 0.3)
+        self.anxiety_score = None
+        # Students are recognised by their face, so that a returning student can continue with their schedule
+        self.profiles = ProfileStore(profiles_db or self.config_data.get('profiles_db', 'profiles.db'))
+        self.face_id = None
+        self.startup.background('audio workers', self.audio_features.warm_up)
+        # Until the local intent index is built, all intents simply come from Dialogflow
+        self.startup.background('intent index', self.load_intent_matcher)
+        self.dialogue = DialogueEngine(self, self.dialogue_states(), 'feeling')
+
+    def warm_up_nlp(self):
+        # One after the other, as importing nltk from two threads at once can fail
+        split_sentences('Warm up.')
+        self.sentiment.warm_up()
+
+    def wait_for(self, lock, event):
+        """Waits for the robot event that releases the given semaphore (at most event_timeout seconds);
+        returns whether it came in."""
+        if lock.acquire(timeout=self.event_timeout):
+            return True
+        logger.warning('No {} within {}s, carrying on', event, self.event_timeout)
+        return False
+
+    def load_intent_matcher(self, export='dialogflow.zip'):
+        try:
+            self.intent_matcher = IntentMatcher.from_export(export)
+        except Exception as e:
+            logger.error(f'Loading the local intent matcher failed with: {e}')
 
     def standby_loop(self):
         self.activation = False
+        self.wake_phrases.reset()
         # wait for activation
-        while not self.activation:
-            self.set_audio_context('activation')
-            self.start_listening()
-            self.intent_lock.acquire(timeout=3)
+        while self.running and not self.activation:
+            with self.batch():
+                self.set_audio_context('activation')
+                self.set_audio_hints(self.wake_hints)
+                self.start_listening()
+            started = time.monotonic()
+            while self.running and not self.activation:
+                remaining = max(started, self.last_heard or started) + self.standby_timeout - time.monotonic()
+                if remaining <= 0:
+                    logger.debug('Nothing heard for {}s, restarting to listen', self.standby_timeout)
+                    break
+                # Woken up by every understood intent, and at least every second to notice a stop
+                self.intent_lock.acquire(timeout=min(1.0, remaining))
             self.stop_listening()
 
     def main(self):
         self.running = True
         # Setting language
         logger.info('Setting language')
-        self.set_language('en-US')
-        self.language_lock.acquire()
+        self.switch_language()
+        self.startup.mark('language')
+        self.startup.report()
         # Robot gets activated
         logger.info('Activating Nao')
-        self.set_non_idle()
-        self.set_audio_hints(['study', 'buddy', 'robot', 'Nao', 'hello', 'hi'])
-        self.say('Oh.')
-        self.do_gesture('animations/Stand/Gestures/Yes_3')
-        self.text_lock.acquire()
-        self.gesture_lock.acquire()
+        with self.batch():
+            self.set_non_idle()
+            self.start_looking()
+            self.say(self.texts.response('activated'))
+            self.do_gesture('animations/Stand/Gestures/Yes_3')
+        self.wait_for(self.text_lock, 'TextDone')
+        self.wait_for(self.gesture_lock, 'GestureDone')
         self.set_eye_color('yellow')
-        self.eye_lock.acquire()
+        self.wait_for(self.eye_lock, 'EyeColourDone')
 
         while self.running:
 
             # Standby mode until summoned
             self.standby_loop()
-            if self.activation:
-                self.set_eye_color('white')
-                self.eye_lock.acquire()
+            if not self.running:
+                break
+            self.switch_language()
 
-            # Robot greets friendly and asks how student is doing
-            logger.info('Asking about student feelings')
-            self.ask(self.questions['students_feeling'],
-                     'students_feeling', timeout=8, emotion='empathetic')
-
-            # Let's fix the students anxiouseness!
-            if self.student_is_anxious():
-                # robot empathises and asks for time
-                logger.info(
-                    'Empathising with anxious student and ask time remaining')
-                self.set_eye_color('blue')
-                self.eye_lock.acquire()
-                self.say(
-                    f"I'm sorry to hear that you feel {self.student_feeling}.", emotion='empathetic')
-                self.text_lock.acquire()
-
-                self.ask(self.questions['time_left'],
-                         'time_left', emotion='empathetic')
-                logger.info(f'Student has {self.hours_remaining} remaining')
-                self.say_animated(
-                    f'{self.hours_remaining}? With my help, that should be enough to get it all done!', emotion='happy')
-                self.text_lock.acquire()
-
-                # robot asks for the todos
-                logger.info('Asking student for estimated workload')
-                self.ask(self.questions['time_needed'], 'time_needed')
-
-                # calculate the schedule and read it out loud
-                schedule = self.compute_schedule(
-                    self.hours_remaining, self.hours_needed)
-                logger.debug(f'Schedule: {schedule}')
-                logger.info('Reading schedule...')
-                self.say_animated(
-                    f"Here is your study schedule: {schedule}. I'll update you with the rest of the schedule later.")
-                self.text_lock.acquire()
-                # End conversation with motivational quote
-                self.tell_random_quote()
-
-            # Student seems to be doing fine (not anxious). No scheduling needed
-            else:
-                self.set_eye_color('yellow')
-                self.eye_lock.acquire()
-                self.ask(self.questions['extra_motivation'],
-                         'yes_no', emotion='happy')
-                if self.yes_answer:
-                    logger.info('Student requested motivation')
-                    self.tell_random_quote()
-
-            self.say_animated(
-                'Okay. Good luck with your studies. You can ask me for help anytime!', emotion='happy')
-            self.do_gesture('animations/Stand/Gestures/BowShort_1')
-            self.text_lock.acquire()
-            self.gesture_lock.acquire()
+            # Whoever is in front of the robot now is the student; their profile was (pre)fetched on recognition
+            student = self.face_id
+            profile = self.profiles.get(student) if student is not None else None
+            plan, hours_elapsed = active_plan(profile)
+            self.dialogue.run(Conversation(student=student, profile=profile, plan=plan, hours_elapsed=hours_elapsed))
 
         logger.warning('Stopping')
+        self.stop_looking()
         self.stop()
+        if self.metrics is not None:
+            self.metrics.log_summary()
+
+    def switch_language(self):
+        """Takes the current content for the next conversation, in the language that it should be in: the configured
+        language (again, after it was changed in the configuration file), or the one the student asked for, if
+        there is content for it. Sets the robot to that language when it is not already."""
+        snapshot = self.content.snapshot
+        if snapshot.language != self.configured_language:
+            self.language = self.configured_language = snapshot.language
+        if self.language not in snapshot.languages:
+            logger.warning('No content for {}, speaking {}', self.language, snapshot.language)
+            self.language = snapshot.language
+        self.texts = snapshot.with_language(self.language)
+        if self.language != self.robot_language:
+            self.set_language(self.language)
+            self.wait_for(self.language_lock, 'LanguageChanged')
+            self.robot_language = self.language
+
+    def dialogue_states(self):
+        """The conversation, from asking how the student is doing until saying goodbye (see dialogue.DialogueEngine)."""
+        return {
+            # Robot greets friendly and asks how student is doing
+            'feeling': Ask(lambda c: self.texts.question('returning_feeling' if c.profile is not None
+                                                         else 'students_feeling', emotion='empathetic'),
+                           'students_feeling', timeout=8, record=self.record_answers, eye='white',
+                           next=self.after_feeling),
+            # Let's fix the students anxiouseness! The robot empathises, and continues a returning student's schedule
+            # instead of planning all over again
+            'sorry': Say(lambda c: self.texts.response('sorry').format(feeling=' '.join(self.student_feeling)),
+                         emotion='empathetic', animated=False, eye='blue',
+                         next=lambda c: 'progress' if c.plan is not None else 'time_left'),
+            # A returning student reports how much they revised, and the rest of their schedule is replanned
+            'progress': Ask(lambda c: self.texts.question('progress', emotion='empathetic'), 'time_needed',
+                            hints=['hours'], next='resume'),
+            'resume': Say(lambda c: self.texts.response('resume').format(schedule=c.result('resume')),
+                          streamed=True, prefetch=lambda c: self.resume_schedule(c.plan, c.hours_elapsed,
+                                                                                 self.hours_done),
+                          next=self.after_read_out),
+            'time_left': Ask(lambda c: self.texts.question('time_left', emotion='empathetic'), 'time_left',
+                             hints=['hours', 'days'], next='enough_time'),
+            'enough_time': Say(lambda c: self.texts.response('enough_time').format(hours=self.hours_remaining),
+                               emotion='happy', next='time_needed'),
+            'time_needed': Ask(lambda c: self.texts.question('time_needed'), 'time_needed', hints=['hours'],
+                               next='schedule'),
+            'schedule': Say(lambda c: self.texts.response('schedule').format(schedule=c.result('schedule')),
+                            streamed=True, prefetch=self.plan_schedule, next=self.after_read_out),
+            # A read-out that was interrupted (by touching the robot's head) continues where it stopped, if wanted
+            'read_on': Ask(lambda c: self.texts.question('read_on'), 'yes_no', hints=['yes', 'no'],
+                           next=lambda c: 'rest' if self.yes_answer else 'quote'),
+            'rest': Say(lambda c: c.unspoken, streamed=True, next=self.after_read_out),
+            # Student seems to be doing fine (not anxious). No scheduling needed
+            'motivation': Ask(lambda c: self.texts.question('extra_motivation', emotion='happy'), 'yes_no',
+                              hints=['yes', 'no'], eye='yellow',
+                              next=lambda c: 'quote' if self.yes_answer else 'goodbye'),
+            # End conversation with motivational quote (prebuilt with the introduction and the emotion)
+            'quote': Say(lambda c: c.result('quote'), prefetch=lambda c: random.choice(self.texts.quotes('happy')),
+                         next='goodbye'),
+            'goodbye': Say(lambda c: self.texts.response('goodbye'), emotion='happy',
+                           gesture='animations/Stand/Gestures/BowShort_1'),
+        }
+
+    def after_feeling(self, conversation):
+        anxious = self.student_is_anxious()
+        if conversation.student is not None:
+            self.profiles.record_visit(conversation.student, ' '.join(self.student_feeling), self.anxiety_score)
+        return 'sorry' if anxious else 'motivation'
+
+    @staticmethod
+    def after_read_out(conversation):
+        return 'read_on' if conversation.unspoken else 'quote'
+
+    def plan_schedule(self, conversation):
+        """Computes the schedule (and stores it for a returning student) as soon as the hours are known."""
+        schedule = self.compute_schedule(self.hours_remaining, self.hours_needed)
+        if conversation.student is not None:
+            self.profiles.record_plan(conversation.student, self.schedule)
+        logger.debug(f'Schedule: {schedule}')
+        return schedule
+
+    def set_audio_context(self, context):
+        self.audio_context = context
+        super().set_audio_context(context)
+
+    def start_listening(self):
+        # New answer, so any intent (permit) left over from the previous one is no longer relevant
+        self.answered_locally = False
+        while self.intent_lock.acquire(blocking=False):
+            pass
+        with self.answer_audio_cond:
+            self.answer_audio.pop(self.audio_context, None)
+        super().start_listening()
+
+    def on_face_arrived(self, identifier):
+        self.face_id = identifier
+        # Fetched now, so that it is cached by the time the conversation starts
+        profile = self.profiles.get(identifier)
+        logger.info('Recognised {} ({} visits before)', identifier, profile.visits if profile is not None else 0)
+
+    def on_face_left(self, identifier):
+        if self.face_id == identifier:
+            self.face_id = None
+
+    def on_new_audio_file(self, audioFile):
+        # Analysed in the background; student_is_anxious picks up the result. The file name is one on the robot,
+        # which can only be read when the robot shares its file system with us (None: no prosody, stop waiting)
+        if os.path.isfile(audioFile):
+            future = self.audio_features.submit(audioFile)
+        else:
+            logger.debug('Recording {} is not on this machine, no prosody', audioFile)
+            future = None
+        with self.answer_audio_cond:
+            self.answer_audio[self.audio_context] = future
+            self.answer_audio_cond.notify_all()
+
+    def answer_prosody(self, context):
+        """Returns the Prosody of the (last) recorded answer in the given audio context, or None if there is none
+        (in time). The recording comes in shortly after listening has stopped."""
+        deadline = time.monotonic() + self.audio_feature_timeout
+        with self.answer_audio_cond:
+            if not self.answer_audio_cond.wait_for(lambda: context in self.answer_audio,
+                                                   timeout=self.audio_feature_timeout if self.record_answers else 0):
+                return None
+            future = self.answer_audio[context]
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception as e:
+            logger.warning('No prosody for the {} answer: {!r}', context, e)
+            return None
+
+    def on_audio_language(self, languageKey):
+        """The student asked for another language: the next conversation is in it (if there is content for it)."""
+        if languageKey == self.language:
+            return
+        if languageKey not in self.content.snapshot.languages:
+            logger.warning('Asked for {}, but there is no content for it', languageKey)
+            return
+        logger.info('Switching to {} from the next conversation on', languageKey)
+        self.language = languageKey
+
+    def on_speech_text(self, text):
+        self.last_heard = time.monotonic()
+        if self.audio_context == 'activation':
+            # Only the wake phrases activate the robot locally (as standby listening picks up everything said
+            # around it); every interim result is checked, so that it wakes up as soon as the phrase is complete
+            phrase = self.wake_phrases.feed(text, now=self.last_heard)
+            if phrase is not None and not self.activation:
+                logger.info('Wake phrase: {}', phrase)
+                if self.metrics is not None:
+                    self.metrics.heard('wake phrase')
+                self.answered_locally = True
+                self.handle_intent('activation')
+            return
+        matcher = self.intent_matcher
+        if matcher is None or self.answered_locally:
+            return
+        match = matcher.match(text, context=self.audio_context)
+        if match is not None and match.confidence >= self.local_intent_confidence:
+            logger.info('Local intent: {} ({:.2f})', match.intent, match.confidence)
+            if self.metrics is not None:
+                self.metrics.heard(f'local intent {match.intent}')
+            self.answered_locally = True
+            self.handle_intent(match.intent, *match.params)
 
     def on_audio_intent(self, intent_name, *args):
-        logger.info(f'Audio intent: {intent_name}')
-        logger.info(f'Audio intent args: {args}')
+        if self.answered_locally:
+            logger.debug('Ignoring Dialogflow intent {}: already matched locally', intent_name)
+            return
+        self.handle_intent(intent_name, *args)
+
+    def handle_intent(self, intent_name, *args):
+        logger.info('Audio intent: {} {}', intent_name, args)
         if intent_name == 'input.unkown':
             intent_name = None
         if intent_name is not None:
@@ -174,14 +399,25 @@ class StudyBuddyApp(Base.AbstractApplication):
             elif intent_name == 'time_left' and len(args) > 0:
                 self.hours_remaining = args[0]
             elif intent_name == 'time_needed' and len(args) > 0:
-                self.hours_needed = args[0]
+                # The progress question is answered with the same intent (in the same context)
+                if self.dialogue.state == 'progress':
+                    self.hours_done = args[0]
+                else:
+                    self.hours_needed = args[0]
             elif intent_name in ['changing_wish', 'schedule']:
                 logger.error(f'Intent: {intent_name} not implemented.')
                 raise NotImplementedError
+            # Stop waiting for an answer as soon as it is understood
+            self.intent_lock.release()
 
     def on_robot_event(self, event):
         if event == 'TextDone':
             self.text_lock.release()
+        elif event == 'TextStarted':
+            self.text_started_lock.release()
+        elif event in ['FrontTactilTouched', 'MiddleTactilTouched', 'RearTactilTouched']:
+            # Touching the robot's head interrupts a long text after the current sentence
+            self.cancel_speech()
         elif event == 'LanguageChanged':
             self.language_lock.release()
         elif event == 'GestureDone':
@@ -189,69 +425,59 @@ class StudyBuddyApp(Base.AbstractApplication):
         elif event == 'EyeColourDone':
             self.eye_lock.release()
 
-    def ask(self, question, audioContext, attempts=3, timeout=5, emotion=None):
-        # We only want the question to be asked once, right?
-        self.say_animated(question, emotion=emotion)
-        self.text_lock.acquire()
-        # new question, new stuff to understand
-        self.intent_understood = False
-        while attempts > 0 and not self.intent_understood:
-            logger.info(f'Attempts {attempts}| audioContext {audioContext}')
-            self.set_eye_color('white')
-            self.eye_lock.acquire()
-            attempts -= 1
-            self.set_audio_context(audioContext)
-            self.start_listening()
-            self.intent_lock.acquire(timeout=timeout)
-            self.stop_listening()
-            if not self.intent_understood and attempts > 0:
-                self.set_eye_color('red')
-                self.say_animated(self.responses['please_repeat'])
-                self.eye_lock.acquire()
-                self.text_lock.acquire()
-
-        if attempts == 0:
-            self.say_animated(self.responses['repeat_timeout'])
-            raise InteractionException
+    def cancel_speech(self):
+        """Stops a streamed Say state of the dialogue after the sentence(s) that were already sent to the robot."""
+        self.speech_cancelled.set()
 
     def student_is_anxious(self):
         if len(self.student_feeling) == 0:
             logger.error(
                 f'Could not retrieve student feelings to test anxiety.')
-            raise InteractionException
+            raise NotUnderstood('students_feeling')
         resp = self.student_feeling[0]
-        logger.debug(f'Analysing sentiment of {resp}')
-        sent = TextBlob(resp).sentiment
+        logger.debug('Analysing sentiment of {}', resp)
+        sent = self.sentiment.score(resp)
         polarity = sent.polarity
         subjectivity = sent.subjectivity
-        logger.info(f'Student polarity: {polarity}')
-        logger.info(f'Student subjectivity: {subjectivity}')
-        if polarity < 0.4:
+        logger.info('Student polarity: {} subjectivity: {}', polarity, subjectivity)
+        score = polarity
+        features = self.answer_prosody('students_feeling')
+        if features is not None:
+            score -= self.prosody_weight * (arousal(features) - 0.5)
+            logger.info('Student prosody: {} (score {:.2f})', features, score)
+        self.anxiety_score = score
+        if score < self.sentiment.anxiety_threshold:
             logger.info(f'Student classified as anxious')
             return True
         logger.info('Student NOT classified as anxious.')
         return False
 
-    def tell_random_quote(self):
-        quotes = self.config_data['motivational_quotes']
-        rndm_quote = quotes[random.randint(0, len(quotes) - 1)]
-        self.say_animated('And never forget: ' + rndm_quote, emotion='happy')
-        self.text_lock.acquire()
-
     def compute_schedule(self, timeLeft, timeNeeded, **kwargs):
         logger.info(
             f'Computing schedule for {timeNeeded}h work in {timeLeft}h time')
-        sched = make_schedule(timeNeeded, timeLeft, **kwargs)
-        return '. '.join(sched)
+        # Keep the whole schedule, so that the rest of it can be read out (or replanned) later
+        self.schedule = Schedule(timeNeeded, timeLeft, **kwargs)
+        return '. '.join(self.schedule.page(0))
+
+    def resume_schedule(self, plan, hours_elapsed, hours_done=None):
+        """Recreates the schedule of a profiles.Plan, replanned with the hours of revision the student did since
+        it was made (if known), and returns its first page from the current activity on."""
+        logger.info(f'Resuming the schedule made {hours_elapsed:.1f}h ago, {hours_done}h revised since')
+        self.schedule = Schedule(plan.time_est, plan.time_remaining, start_hour=plan.start_hour,
+                                 fudge_ratio=plan.fudge_ratio)
+        try:
+            self.schedule.replan(float(hours_done), hours_elapsed)
+        except (TypeError, ValueError):
+            pass
+        return '. '.join(self.schedule.page(0, hours_elapsed=hours_elapsed))
 
     def stop(self):
         self.running = False
+        self.content.stop()
+        self.dialogue.stop()
         super().stop()
-
-
-class InteractionException(Exception):
-    def __init__(self):
-        super().__init__()
+        self.audio_features.stop()
+        self.profiles.close()
 
 
 if __name__ == '__main__':
@@ -259,17 +485,17 @@ if __name__ == '__main__':
     # Get current datetime stamp
     now = datetime.now().strftime("%m-%d-%H_%M_%S")
 
-    # Configure logging to stderr at debug level
-    logger.remove()
-    logger.add(sys.stderr, level='DEBUG')
-
-    # Configure logging to file at debug level
-    if not os.path.exists(LOGDIR):
-        os.makedirs(LOGDIR)
-    logger.add("logs/{time}.log", level="DEBUG")
+    # Log to stderr, a rotated text log and a JSONL session log at debug level, off the listener thread
+    configure_logging(LOGDIR, level='DEBUG')
 
     # Initialise and run the application
-    app = StudyBuddyApp()
+    # Record all messages of the session, so that it can be inspected and replayed (see session_trace)
+    # Connect to Redis as configured (e.g. over a Unix socket when it runs on the robot's machine)
+    with open('config/config.json') as f:
+        redis_settings = json.load(f).get('redis', {})
+    app = StudyBuddyApp(startup=STARTUP, trace=os.path.join(LOGDIR, f'session_{now}.trace'),
+                        transport=redis_settings)
+    app.metrics.dump_periodically(os.path.join(LOGDIR, 'metrics.jsonl'))
     try:
         # Run the application
         logger.warning('Running application...')
@@ -0,0 +1,31 @@
+from wake_phrase import WakePhraseDetector
+
+PHRASES = ['hello study buddy', "what's up buddy", "what's up study buddy"]
+
+
+def test_phrase_in_one_text():
+    assert WakePhraseDetector(PHRASES).feed('well hello study buddy', now=0.0) == 'hello study buddy'
+
+
+def test_phrase_split_over_two_texts():
+    detector = WakePhraseDetector(PHRASES)
+    assert detector.feed("what's up", now=0.0) is None
+    assert detector.feed('study buddy', now=1.0) == "what's up study buddy"
+
+
+def test_tail_is_kept_after_many_words():
+    detector = WakePhraseDetector(PHRASES)
+    assert detector.feed("one two three four five what's up", now=0.0) is None
+    assert detector.feed('study buddy', now=1.0) == "what's up study buddy"
+
+
+def test_texts_far_apart_are_not_joined():
+    detector = WakePhraseDetector(PHRASES)
+    assert detector.feed("what's up", now=0.0) is None
+    assert detector.feed('study buddy', now=WakePhraseDetector.max_gap + 1.0) is None
+
+
+def test_single_word_phrases_keep_no_tail():
+    detector = WakePhraseDetector(['buddy'])
+    assert detector.feed('hello', now=0.0) is None
+    assert detector.feed('buddy', now=1.0) == 'buddy'
@@ -0,0 +1,180 @@
+import time
+from collections import defaultdict
+from threading import Event, Lock
+import redis
+from loguru import logger
+from metrics import LatencyHistogram
+
+# What a lost (or unreachable) Redis server raises
+CONNECTION_ERRORS = (redis.ConnectionError, redis.TimeoutError, OSError)
+
+
+class Transport(object):
+    """The connection to Redis that applications (and the SessionHub and RobotSimulator) publish and subscribe with.
+    Connects over TCP (host and port) or, when a unix_socket_path is given, over a Unix domain socket (which has a
+    lower latency when Redis runs on the same machine, e.g. 'unixsocket /var/run/redis/redis.sock' in redis.conf).
+    All commands share a bounded pool of connections: when all of them are in use, a command waits (up to the
+    socket timeout) for one to be returned instead of opening yet another connection.
+    Redis going away is survived: publishing retries with an exponential backoff (up to publish_timeout seconds),
+    and a Subscription reconnects and resubscribes to all of its channels and patterns. Messages that are
+    published while a subscriber is disconnected are lost, as always with Redis pub/sub.
+    latencies keeps a histogram of how long it took to get through each outage:
+     - 'redis resubscribe': from losing a subscription until it was resubscribed;
+     - 'redis publish': from the first failed attempt to publish until it succeeded.
+    These are also recorded in the given metrics (see metrics.ActionMetrics), if any."""
+
+    # Seconds before the first attempt to reconnect, doubled after every failed attempt (up to max_backoff)
+    backoff = 0.05
+    max_backoff = 0.5
+    # Subscriptions try again more often than publishing: whatever is published before a subscriber is back is lost,
+    # so subscribers should (usually) be back before the publishers that retry
+    max_resubscribe_backoff = 0.1
+    # Seconds that publishing keeps retrying while Redis is unreachable, before it gives up (and raises)
+    publish_timeout = 10.0
+    # Seconds after which an idle connection is checked (with a PING) before it is used
+    health_check_interval = 15
+
+    def __init__(self, host='localhost', port=6379, unix_socket_path=None, max_connections=8, socket_timeout=2.0,
+                 socket_connect_timeout=1.0, client=None, metrics=None, **connection_kwargs):
+        """The remaining connection arguments are passed on to the connections (e.g. db or password).
+        A Redis client (e.g. of fakeredis) can be given instead, to use that (and its pool) as it is."""
+        if client is not None:
+            self.redis = client
+            self.pool = client.connection_pool
+        else:
+            connection_kwargs.update(socket_timeout=socket_timeout, health_check_interval=self.health_check_interval)
+            if unix_socket_path is not None:
+                connection_kwargs.update(connection_class=redis.UnixDomainSocketConnection, path=unix_socket_path)
+            else:
+                connection_kwargs.update(host=host, port=port, socket_connect_timeout=socket_connect_timeout)
+            self.pool = redis.BlockingConnectionPool(max_connections=max_connections, timeout=socket_timeout,
+                                                     **connection_kwargs)
+            self.redis = redis.Redis(connection_pool=self.pool)
+        self.address = unix_socket_path or f'{host}:{port}'
+        self.metrics = metrics
+        self.latencies = defaultdict(LatencyHistogram)
+        self.__latencies_lock = Lock()
+        self.__closed = Event()
+        self.__close_lock = Lock()
+
+    def execute(self, actions):
+        """Publishes the (channel, data) actions in order, in a single pipeline when there are more than one.
+        While Redis is unreachable, the whole pipeline is retried (so an action that did go out just before the
+        connection was lost may be published twice)."""
+        if not actions:
+            return
+        failed_at = None
+        delay = self.backoff
+        while True:
+            try:
+                if len(actions) == 1:
+                    self.redis.publish(*actions[0])
+                else:
+                    pipe = self.redis.pipeline(transaction=False)
+                    for channel, data in actions:
+                        pipe.publish(channel, data)
+                    pipe.execute()
+                break
+            except CONNECTION_ERRORS as e:
+                now = time.monotonic()
+                if failed_at is None:
+                    failed_at = now
+                    logger.warning(f'Publishing to Redis at {self.address} failed, retrying: {e}')
+                if now - failed_at >= self.publish_timeout or self.__closed.is_set():
+                    raise
+                self.__closed.wait(delay)
+                delay = min(2 * delay, self.max_backoff)
+        if failed_at is not None:
+            self.observe('redis publish', time.monotonic() - failed_at)
+
+    def publish(self, channel, data):
+        self.execute([(channel, data)])
+
+    def subscribe(self, channels=(), patterns=()):
+        return Subscription(self, channels, patterns)
+
+    def wait(self, seconds):
+        """Sleeps (e.g. for a backoff) until the time passed or the transport was closed; returns whether it was."""
+        return self.__closed.wait(seconds)
+
+    def observe(self, label, seconds):
+        logger.info(f'Recovered from losing Redis at {self.address} ({label}) after {1000 * seconds:.0f}ms')
+        with self.__latencies_lock:
+            self.latencies[label].observe(seconds)
+        if self.metrics is not None:
+            self.metrics.observe(label, seconds)
+
+    def snapshot(self):
+        with self.__latencies_lock:
+            return {label: histogram.summary() for label, histogram in sorted(self.latencies.items())}
+
+    def close(self):
+        """Stops all retries, and closes the connections of the pool (once, even when called from several threads:
+        redis-py fails to close a connection that another thread is closing)."""
+        with self.__close_lock:
+            if self.__closed.is_set():
+                return
+            self.__closed.set()
+            self.pool.disconnect()
+
+
+class Subscription(object):
+    """A subscription to channels and/or patterns of a Transport that survives losing its connection:
+    get_message never raises a connection error, but returns None until the connection is back.
+    It then reconnects (every time get_message is called, with an exponential backoff between the attempts),
+    and once connected, redis-py resubscribes to all channels and patterns right away."""
+
+    def __init__(self, transport, channels=(), patterns=()):
+        self.transport = transport
+        self.__pubsub = transport.redis.pubsub(ignore_subscribe_messages=True)
+        if channels:
+            self.__pubsub.subscribe(*channels)
+        if patterns:
+            self.__pubsub.psubscribe(*patterns)
+        self.__lost_at = None
+        self.__retry_at = 0.0
+        self.__delay = transport.backoff
+
+    @property
+    def connected(self):
+        return self.__lost_at is None
+
+    def get_message(self, timeout):
+        """The next message (with the raw channel and data), or None if there was none within the timeout."""
+        if self.__lost_at is not None and not self.__reconnect(timeout):
+            return None
+        try:
+            return self.__pubsub.get_message(timeout=timeout)
+        except CONNECTION_ERRORS as e:
+            # Not every error disconnects by itself (e.g. the server closing the connection while waiting for a
+            # message), and a connection that is still open would not reconnect
+            self.__pubsub.connection.disconnect()
+            logger.warning(f'Lost the subscription to Redis at {self.transport.address}: {e}')
+            self.__lost_at = time.monotonic()
+            self.__retry_at = self.__lost_at
+            self.__delay = self.transport.backoff
+            return None
+
+    def __reconnect(self, timeout):
+        wait = self.__retry_at - time.monotonic()
+        if wait > 0:
+            self.transport.wait(min(wait, timeout))
+            return False
+        try:
+            # Also resubscribes (see redis.client.PubSub.on_connect)
+            self.__pubsub.connection.connect()
+        except CONNECTION_ERRORS as e:
+            self.__pubsub.connection.disconnect()
+            logger.debug(f'Reconnecting to Redis failed, next attempt in {self.__delay:.2f}s: {e}')
+            self.__retry_at = time.monotonic() + self.__delay
+            self.__delay = min(2 * self.__delay, self.transport.max_resubscribe_backoff)
+            return False
+        lost_at, self.__lost_at = self.__lost_at, None
+        self.transport.observe('redis resubscribe', time.monotonic() - lost_at)
+        return True
+
+    def close(self):
+        try:
+            self.__pubsub.close()
+        except CONNECTION_ERRORS:
+            pass
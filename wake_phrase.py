@@ -0,0 +1,42 @@
+import time
+from intent_matcher import tokenize
+
+
+class WakePhraseDetector(object):
+    """Spots the phrases that activate the robot (e.g. 'hello study buddy') in the texts recognised while it is
+    listening in standby, without waiting for Dialogflow. Texts are fed one after the other as they come in:
+    interim results (that repeat and extend the words so far) as well as final ones. The last words of the
+    previous text are kept, so that a phrase that was split over two results is found as well (unless the
+    previous text was recognised more than max_gap seconds earlier, as part of some other utterance)."""
+
+    # Seconds between two texts after which they no longer count as parts of the same utterance
+    max_gap = 3.0
+
+    def __init__(self, phrases):
+        self.phrases = {tuple(tokenize(phrase)) for phrase in phrases} - {()}
+        self.__lengths = sorted({len(phrase) for phrase in self.phrases})
+        self.__tail = []
+        self.__fed_at = None
+
+    def feed(self, text, now=None):
+        """Returns the wake phrase (as a string) that the recognised text completes, or None.
+        now is the (time.monotonic) time at which the text was recognised."""
+        now = time.monotonic() if now is None else now
+        if self.__fed_at is not None and now - self.__fed_at > self.max_gap:
+            self.__tail = []
+        self.__fed_at = now
+        tokens = self.__tail + tokenize(text)
+        for length in self.__lengths:
+            for i in range(len(tokens) - length + 1):
+                phrase = tuple(tokens[i:i + length])
+                if phrase in self.phrases:
+                    self.__tail = []
+                    return ' '.join(phrase)
+        # Enough words to complete the longest phrase with the next text
+        kept = self.__lengths[-1] - 1 if self.__lengths else 0
+        self.__tail = tokens[-kept:] if kept > 0 else []
+        return None
+
+    def reset(self):
+        self.__tail = []
+        self.__fed_at = None